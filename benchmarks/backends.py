@@ -0,0 +1,61 @@
+"""Compares executor types on a CPU bound job. Run from the repository root
+with ``PYTHONPATH=. python benchmarks/backends.py``."""
+import argparse
+import sys
+import time
+
+from flask import Flask
+
+from flask_executor import Executor
+from flask_executor.helpers import cpu_count, gil_enabled, interpreter_pool
+
+from benchmarks.workloads import fib
+
+
+def run(executor_type, tasks, n, workers):
+    app = Flask(__name__)
+    app.config['EXECUTOR_TYPE'] = executor_type
+    app.config['EXECUTOR_MAX_WORKERS'] = workers
+    app.config['EXECUTOR_PROCESS_MAX_WORKERS'] = workers
+    executor = Executor(app)
+    job = executor.job(fib, kind='cpu') if executor_type == 'hybrid' else None
+    with app.test_request_context(''):
+        # Start the workers first, so that only the tasks are timed
+        executor.prestart()
+        started = time.perf_counter()
+        if job is not None:
+            futures = [job.submit(n) for _ in range(tasks)]
+        else:
+            futures = [executor.submit(fib, n) for _ in range(tasks)]
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - started
+    executor.shutdown()
+    return elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tasks', type=int, default=32)
+    parser.add_argument('--n', type=int, default=25, help='the Fibonacci number each task computes')
+    parser.add_argument('--workers', type=int, default=cpu_count())
+    args = parser.parse_args(argv)
+
+    types = ['thread', 'process']
+    if not gil_enabled():
+        types.append('hybrid')
+    if interpreter_pool() is not None:
+        types.append('interpreter')
+    print('Python {}, GIL {}, {} workers, {} tasks of fib({})'.format(
+        sys.version.split()[0], 'enabled' if gil_enabled() else 'disabled',
+        args.workers, args.tasks, args.n
+    ))
+    baseline = None
+    for executor_type in types:
+        elapsed = run(executor_type, args.tasks, args.n, args.workers)
+        baseline = baseline or elapsed
+        print('{:<12} {:8.3f}s {:6.2f}x'.format(executor_type, elapsed, baseline / elapsed))
+
+
+if __name__ == '__main__':
+    main()
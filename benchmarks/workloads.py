@@ -0,0 +1,8 @@
+# Kept apart from the benchmark script so that process and interpreter
+# workers can import it
+
+
+def fib(n):
+    if n <= 2:
+        return 1
+    return fib(n - 1) + fib(n - 2)
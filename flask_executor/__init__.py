@@ -1,5 +1,7 @@
+from flask_executor.admission import ExecutorOverloaded
 from flask_executor.executor import Executor
+from flask_executor.retry import RetryPolicy
 
 
-__all__ = ('Executor',)
+__all__ = ('Executor', 'ExecutorOverloaded', 'RetryPolicy')
 __version__ = '0.10.0'
@@ -0,0 +1,116 @@
+import functools
+import math
+import time
+
+from werkzeug.exceptions import ServiceUnavailable
+
+
+PRIORITIES = ('low', 'normal', 'high')
+
+
+class ExecutorOverloaded(Exception):
+    """Raised when a task is submitted to an executor that is too busy to
+    accept it. Register :func:`overloaded_handler` as an error handler, as
+    :meth:`~flask_executor.Executor.init_app` does when admission control
+    is configured unless the application has a handler for it already, to
+    turn it into a ``503 Service Unavailable`` response.
+
+    :param load: The executor's load when the task was rejected, as a
+                 fraction of its limits.
+    :param priority: The priority of the rejected task.
+    :param retry_after: Seconds after which the client may try again.
+    """
+
+    def __init__(self, load, priority, retry_after):
+        super().__init__(
+            'executor overloaded ({:.0%} of capacity), {} priority task '
+            'rejected'.format(load, priority)
+        )
+        self.load = load
+        self.priority = priority
+        self.retry_after = retry_after
+
+
+def overloaded_handler(exc):
+    """A Flask error handler for :exc:`ExecutorOverloaded` that returns a
+    ``503 Service Unavailable`` response with a ``Retry-After`` header.
+
+    Example::
+
+        app.register_error_handler(ExecutorOverloaded, overloaded_handler)
+    """
+    return ServiceUnavailable(retry_after=int(math.ceil(exc.retry_after))).get_response()
+
+
+class AdmissionController:
+    """Decides whether an executor accepts new tasks, based on the number of
+    tasks in flight and on how long recent tasks waited for a worker. Once
+    either passes its limit the executor rejects new tasks straight away
+    with :exc:`ExecutorOverloaded`, rather than letting the queue, and the
+    latency of everything in it, grow without bound.
+
+    Low priority tasks are shed earlier, once the load reaches
+    ``shed_ratio`` of the limits, to leave room for normal ones. High
+    priority tasks are always accepted.
+
+    :param max_inflight: The most tasks that may be queued in the pool or
+                         running.
+    :param max_queue_wait: The longest average time, in seconds, that tasks
+                           may wait for a worker. Only tasks run on threads
+                           are measured.
+    :param shed_ratio: The fraction of the limits at which low priority
+                       tasks are rejected.
+    :param retry_after: Seconds clients are told to wait before retrying.
+    :param smoothing: The weight of each new measurement in the moving
+                      average of queue wait times.
+    """
+
+    def __init__(self, max_inflight=None, max_queue_wait=None, shed_ratio=0.8,
+                 retry_after=1.0, smoothing=0.2):
+        if max_inflight is None and max_queue_wait is None:
+            raise ValueError("max_inflight or max_queue_wait must be set")
+        if not 0 < float(shed_ratio) <= 1:
+            raise ValueError("shed_ratio must be greater than 0 and at most 1")
+        self.max_inflight = int(max_inflight) if max_inflight is not None else None
+        self.max_queue_wait = float(max_queue_wait) if max_queue_wait is not None else None
+        self.shed_ratio = float(shed_ratio)
+        self.retry_after = float(retry_after)
+        self.smoothing = float(smoothing)
+        self.queue_wait = 0.0
+
+    def load(self, inflight):
+        """The executor's load as a fraction of the limits, given the number
+        of tasks in flight."""
+        load = 0.0
+        if self.max_inflight is not None:
+            load = inflight / self.max_inflight
+        if self.max_queue_wait is not None:
+            if not inflight:
+                # Nothing is queued, whatever earlier tasks waited
+                self.queue_wait = 0.0
+            load = max(load, self.queue_wait / self.max_queue_wait)
+        return load
+
+    def admit(self, inflight, priority='normal'):
+        """Raise :exc:`ExecutorOverloaded` if a task of the given priority
+        should be rejected."""
+        if priority == 'high':
+            return
+        load = self.load(inflight)
+        if load >= (self.shed_ratio if priority == 'low' else 1.0):
+            raise ExecutorOverloaded(load, priority, self.retry_after)
+
+    def record_wait(self, wait):
+        """Add a task's wait for a worker to the moving average."""
+        self.queue_wait += self.smoothing * (wait - self.queue_wait)
+
+    def timed(self, fn):
+        """Wrap ``fn`` to record how long it waits, from now, to start."""
+        queued_at = time.monotonic()
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            self.record_wait(time.monotonic() - queued_at)
+            return fn(*args, **kwargs)
+
+        return wrapper
@@ -0,0 +1,98 @@
+import json
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from flask_executor.debug import executors
+
+
+executor_cli = AppGroup('executor', help='Inspect and run Flask-Executor executors.')
+
+
+def _fetch(url, path, timeout=10, **params):
+    # Imported here, as only the commands that talk to a server need it
+    from urllib.error import URLError
+    from urllib.parse import urlencode
+    from urllib.request import urlopen
+
+    url = '{}/{}?{}'.format(url.rstrip('/'), path, urlencode(params))
+    try:
+        with urlopen(url, timeout=timeout) as response:
+            return json.load(response)
+    except (URLError, ValueError) as exc:
+        raise click.ClickException('Could not fetch {}: {}'.format(url, exc))
+
+
+def _label(name):
+    return repr(name) if name else 'default'
+
+
+@executor_cli.command('list')
+def list_command():
+    """List the executors configured on the application."""
+    for name, executor in sorted(executors(current_app).items()):
+        max_workers = current_app.config.get(executor.EXECUTOR_MAX_WORKERS)
+        click.echo('{}: {}, {} workers'.format(
+            _label(name), executor._executor_type,
+            'default' if max_workers is None else max_workers
+        ))
+
+
+@executor_cli.command('stats')
+@click.option('--url', required=True,
+              help='Where the debug blueprint is mounted on the running application.')
+def stats_command(url):
+    """Show queued and running tasks, and stored futures, of a running
+    application's executors."""
+    for stats in _fetch(url, '')['executors']:
+        click.echo('{}: {}, {} workers, {} in flight, {} queued{}'.format(
+            _label(stats['name']), stats['type'],
+            'unstarted' if stats['max_workers'] is None else stats['max_workers'],
+            stats['inflight'], stats['queued'], ', draining' if stats['draining'] else ''
+        ))
+        for task in sorted(stats['running'], key=lambda task: -(task['elapsed'] or 0)):
+            elapsed = '' if task['elapsed'] is None else ' for {:.1f}s'.format(task['elapsed'])
+            click.echo('  running {}{}'.format(task['task'], elapsed))
+        click.echo('  futures: {}'.format(', '.join(
+            '{} {}'.format(len(keys), state) for state, keys in stats['futures'].items()
+        )))
+        for state in ('pending', 'running', 'failed'):
+            for key in stats['futures'][state]:
+                click.echo('    {} {}'.format(state, key))
+
+
+@executor_cli.command('profile')
+@click.option('--url', required=True,
+              help='Where the debug blueprint is mounted on the running application.')
+@click.option('--executor', 'name', default='', help='The name of the executor.')
+@click.option('--seconds', default=5.0, show_default=True, help='How long to sample for.')
+@click.option('--limit', default=10, show_default=True, help='The number of stacks to show.')
+def profile_command(url, name, seconds, limit):
+    """Sample the stacks of a running application's worker threads."""
+    profile = _fetch(url, 'profile', timeout=seconds + 10,
+                     executor=name, seconds=seconds, limit=limit)
+    click.echo('{} samples'.format(profile['samples']))
+    for stack in profile['stacks']:
+        click.echo('\n{} samples of {}:'.format(stack['count'], stack['task']))
+        for frame in stack['frames']:
+            click.echo('  {}'.format(frame))
+
+
+@executor_cli.command('worker')
+@click.option('--executor', 'name', default='', help='The name of the executor.')
+@click.option('--broker', help="Overrides the application's EXECUTOR_BROKER_URL.")
+@click.option('--threads', default=1, show_default=True, help='Tasks to run at once.')
+@click.option('--burst', is_flag=True, help='Exit once the queue is empty.')
+def worker_command(name, broker, threads, burst):
+    """Run tasks for a distributed executor."""
+    from flask_executor.distributed import run_worker
+
+    executor = executors(current_app).get(name)
+    if executor is None:
+        raise click.ClickException('No executor named {}'.format(_label(name)))
+    try:
+        worker = executor.worker(current_app._get_current_object(), broker=broker)
+    except TypeError as exc:
+        raise click.ClickException(str(exc))
+    run_worker(worker, threads=threads, burst=burst)
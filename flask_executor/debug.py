@@ -0,0 +1,48 @@
+from flask import Blueprint, abort, current_app, jsonify, request
+
+from flask_executor.executor import Executor
+
+
+MAX_PROFILE_SECONDS = 60
+
+
+# Not registered by default, since it exposes task names and stacks
+debug_blueprint = Blueprint('executor_debug', __name__)
+
+
+def executors(app):
+    """Return a dict of the executors initialised on ``app``, by name."""
+    return {
+        extension.name: extension for extension in app.extensions.values()
+        if isinstance(extension, Executor)
+    }
+
+
+def _json_key(key):
+    return key if isinstance(key, (str, int, float)) else repr(key)
+
+
+@debug_blueprint.route('/')
+def stats():
+    results = []
+    for name, executor in sorted(executors(current_app).items()):
+        result = executor.stats()
+        result['futures'] = {
+            state: [_json_key(key) for key in keys]
+            for state, keys in result['futures'].items()
+        }
+        results.append(result)
+    return jsonify(executors=results)
+
+
+@debug_blueprint.route('/profile')
+def profile():
+    executor = executors(current_app).get(request.args.get('executor', ''))
+    if executor is None:
+        abort(404)
+    seconds = min(request.args.get('seconds', 5, type=float), MAX_PROFILE_SECONDS)
+    limit = request.args.get('limit', 20, type=int)
+    try:
+        return jsonify(executor.profile(seconds, limit=limit))
+    except TypeError as exc:
+        abort(400, str(exc))
@@ -0,0 +1,415 @@
+import argparse
+import concurrent.futures
+import functools
+import logging
+import os
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+
+from werkzeug.utils import import_string
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Broker:
+    """The interface through which a :class:`DistributedExecutor` hands
+    tasks to workers, and workers hand back results. Tasks and results are
+    opaque, pickled bytes. Subclass it to use another store, and pass an
+    instance as ``EXECUTOR_BROKER_URL``.
+
+    A task is ``'pending'`` until a worker claims it, then ``'running'``
+    and finally ``'done'`` once its result has been stored. A worker that
+    dies while running a task never stores its result, so the task stays
+    ``'running'`` and its Future never resolves, unless the broker hands
+    the task out again, as :class:`SQLiteBroker` does once a lease expires.
+    """
+
+    def put(self, queue, task_id, payload):
+        """Add a pending task to ``queue``."""
+        raise NotImplementedError
+
+    def claim(self, queue, worker):
+        """Mark the oldest pending task in ``queue`` as running on
+        ``worker`` and return its ``(task_id, payload)``, or ``None`` if
+        there are no pending tasks."""
+        raise NotImplementedError
+
+    def finish(self, task_id, result):
+        """Store the result of a running task."""
+        raise NotImplementedError
+
+    def states(self, task_ids):
+        """Return a dict mapping each of ``task_ids`` that is running or
+        done to a ``(state, result)`` tuple."""
+        raise NotImplementedError
+
+    def cancel(self, task_id):
+        """Withdraw a task. A task that is already running completes, but
+        its result is discarded."""
+        raise NotImplementedError
+
+    def discard(self, task_id):
+        """Forget a task whose result has been collected."""
+        raise NotImplementedError
+
+
+class SQLiteBroker(Broker):
+    """A :class:`Broker` that keeps tasks in an SQLite database, for
+    executors and workers that share a host, and for testing.
+
+    With a ``lease``, a task that has been running for longer than
+    ``lease`` seconds is taken to belong to a worker that died, and is
+    claimed again by the next worker that asks. The lease must be longer
+    than the longest task, or slow tasks will run more than once.
+
+    :param path: The database file, which is created if it doesn't exist.
+    :param lease: Seconds after which a running task may be claimed again,
+                  or ``None`` to never claim it again.
+    """
+
+    def __init__(self, path, lease=None):
+        if path in ('', ':memory:'):
+            raise ValueError("SQLite brokers need a database file that workers can share")
+        if lease is not None and float(lease) <= 0:
+            raise ValueError("lease must be greater than zero")
+        self.path = path
+        self.lease = float(lease) if lease is not None else None
+        self._local = threading.local()
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS flask_executor_tasks ('
+            'id TEXT PRIMARY KEY, queue TEXT NOT NULL, state TEXT NOT NULL, '
+            'payload BLOB, result BLOB, worker TEXT, created REAL NOT NULL, claimed REAL)'
+        )
+        self._connection().execute(
+            'CREATE INDEX IF NOT EXISTS flask_executor_tasks_pending '
+            'ON flask_executor_tasks (queue, state, created)'
+        )
+
+    def _connection(self):
+        # SQLite connections can't be shared between threads
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+        return connection
+
+    def put(self, queue, task_id, payload):
+        self._connection().execute(
+            "INSERT INTO flask_executor_tasks (id, queue, state, payload, created) "
+            "VALUES (?, ?, 'pending', ?, ?)",
+            (task_id, queue, payload, time.time())
+        )
+
+    def claim(self, queue, worker):
+        connection = self._connection()
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            if self.lease is None:
+                row = connection.execute(
+                    "SELECT id, payload FROM flask_executor_tasks "
+                    "WHERE queue = ? AND state = 'pending' ORDER BY created LIMIT 1",
+                    (queue,)
+                ).fetchone()
+            else:
+                # Tasks whose lease has expired were left by workers that died
+                row = connection.execute(
+                    "SELECT id, payload FROM flask_executor_tasks "
+                    "WHERE queue = ? AND (state = 'pending' OR "
+                    "(state = 'running' AND claimed < ?)) ORDER BY created LIMIT 1",
+                    (queue, now - self.lease)
+                ).fetchone()
+            if row is not None:
+                connection.execute(
+                    "UPDATE flask_executor_tasks SET state = 'running', worker = ?, claimed = ? "
+                    "WHERE id = ?",
+                    (worker, now, row[0])
+                )
+        finally:
+            connection.execute('COMMIT')
+        return row
+
+    def finish(self, task_id, result):
+        connection = self._connection()
+        connection.execute(
+            "DELETE FROM flask_executor_tasks WHERE id = ? AND state = 'cancelled'",
+            (task_id,)
+        )
+        connection.execute(
+            "UPDATE flask_executor_tasks SET state = 'done', result = ?, payload = NULL "
+            "WHERE id = ?",
+            (result, task_id)
+        )
+
+    def states(self, task_ids):
+        states = {}
+        task_ids = list(task_ids)
+        # Stay under SQLite's limit on the number of query parameters
+        for start in range(0, len(task_ids), 500):
+            chunk = task_ids[start:start + 500]
+            rows = self._connection().execute(
+                "SELECT id, state, result FROM flask_executor_tasks "
+                "WHERE state IN ('running', 'done') AND id IN ({})".format(
+                    ', '.join('?' * len(chunk))
+                ),
+                chunk
+            )
+            for task_id, state, result in rows:
+                states[task_id] = (state, result)
+        return states
+
+    def cancel(self, task_id):
+        connection = self._connection()
+        connection.execute(
+            "DELETE FROM flask_executor_tasks WHERE id = ? AND state IN ('pending', 'done')",
+            (task_id,)
+        )
+        connection.execute(
+            "UPDATE flask_executor_tasks SET state = 'cancelled' WHERE id = ?",
+            (task_id,)
+        )
+
+    def discard(self, task_id):
+        self._connection().execute(
+            "DELETE FROM flask_executor_tasks WHERE id = ?", (task_id,)
+        )
+
+
+def make_broker(url, lease=None):
+    """Create a :class:`Broker` from ``EXECUTOR_BROKER_URL``, which may be a
+    broker instance, an import string for a broker class or factory, or an
+    SQLite URL such as ``'sqlite:////var/run/myapp/tasks.db'`` (an absolute
+    path) or ``'sqlite:///tasks.db'`` (relative to the working directory).
+
+    :param lease: The ``lease`` of an SQLite broker, see
+                  :class:`SQLiteBroker`.
+    """
+    if isinstance(url, Broker):
+        return url
+    if url is None:
+        raise ValueError("The distributed executor type requires EXECUTOR_BROKER_URL.")
+    if url.startswith('sqlite:///'):
+        return SQLiteBroker(url[len('sqlite:///'):], lease=lease)
+    if url.startswith('sqlite:'):
+        raise ValueError(
+            "{} is not a valid SQLite broker URL, which must start with "
+            "'sqlite:///'.".format(url)
+        )
+    return import_string(url)()
+
+
+def _dump_outcome(ok, value):
+    try:
+        return pickle.dumps((ok, value), pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        if ok:
+            value = TypeError('task result could not be pickled: {!r}'.format(value))
+        else:
+            value = RuntimeError(''.join(traceback.format_exception(
+                type(value), value, value.__traceback__
+            )))
+        return pickle.dumps((False, value), pickle.HIGHEST_PROTOCOL)
+
+
+class DistributedExecutor(concurrent.futures.Executor):
+    """An executor that sends tasks through a :class:`Broker` to workers
+    started with ``flask-executor-worker``. Callables and their arguments
+    are pickled, so callables must be importable by the workers. A
+    background thread polls the broker and resolves Futures once workers
+    have stored their results.
+
+    :param broker: The :class:`Broker` shared with the workers.
+    :param queue: The queue to put tasks on, which workers take them from.
+    :param poll_interval: Seconds between polls for results.
+    """
+
+    def __init__(self, broker, queue='default', poll_interval=0.1):
+        self.broker = broker
+        self.queue = queue
+        self.poll_interval = poll_interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._shutdown = False
+
+    def submit(self, fn, *args, **kwargs):
+        payload = pickle.dumps((fn, args, kwargs), pickle.HIGHEST_PROTOCOL)
+        task_id = uuid.uuid4().hex
+        future = concurrent.futures.Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError('cannot schedule new futures after shutdown')
+            self._pending[task_id] = future
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._poll, name='flask-executor-{}-results'.format(self.queue)
+                )
+                self._thread.daemon = True
+                self._thread.start()
+        self.broker.put(self.queue, task_id, payload)
+        future.add_done_callback(functools.partial(self._cancelled, task_id))
+        return future
+
+    submit.__doc__ = concurrent.futures.Executor.submit.__doc__
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        with self._lock:
+            self._shutdown = True
+            pending = list(self._pending.values())
+        if cancel_futures:
+            for future in pending:
+                future.cancel()
+        self._wakeup.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+
+    shutdown.__doc__ = concurrent.futures.Executor.shutdown.__doc__
+
+    def _cancelled(self, task_id, future):
+        if future.cancelled():
+            with self._lock:
+                self._pending.pop(task_id, None)
+            self.broker.cancel(task_id)
+
+    def _poll(self):
+        while True:
+            with self._lock:
+                pending = dict(self._pending)
+                if self._shutdown and not pending:
+                    return
+            try:
+                states = self.broker.states(pending) if pending else {}
+            except Exception:
+                LOGGER.exception('exception polling broker for results')
+                states = {}
+            for task_id, (state, result) in states.items():
+                future = pending[task_id]
+                if state == 'running':
+                    if not future.running():
+                        future.set_running_or_notify_cancel()
+                    continue
+                with self._lock:
+                    self._pending.pop(task_id, None)
+                self.broker.discard(task_id)
+                if future.cancelled() or \
+                        (not future.running() and not future.set_running_or_notify_cancel()):
+                    continue
+                ok, value = pickle.loads(result)
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+
+class Worker:
+    """Takes tasks from a :class:`Broker` queue and runs them, inside an
+    application context when ``app`` is given.
+
+    :param broker: The broker to take tasks from.
+    :param queue: The queue to take tasks from.
+    :param app: The Flask application tasks run in.
+    :param poll_interval: Seconds to wait between polls when the queue is
+                          empty.
+    """
+
+    def __init__(self, broker, queue='default', app=None, poll_interval=0.1):
+        self.broker = broker
+        self.queue = queue
+        self.app = app
+        self.poll_interval = poll_interval
+        self.name = '{}:{}'.format(socket.gethostname(), os.getpid())
+        self._stop = threading.Event()
+
+    def run(self, burst=False):
+        """Run tasks until :meth:`stop` is called or, with ``burst``, until
+        the queue is empty."""
+        name = '{}:{}'.format(self.name, threading.current_thread().name)
+        while not self._stop.is_set():
+            claimed = self.broker.claim(self.queue, name)
+            if claimed is None:
+                if burst:
+                    return
+                self._stop.wait(self.poll_interval)
+                continue
+            task_id, payload = claimed
+            self.broker.finish(task_id, self.execute(payload))
+
+    def stop(self):
+        """Stop taking new tasks."""
+        self._stop.set()
+
+    def execute(self, payload):
+        """Run a pickled task and return its pickled outcome."""
+        try:
+            fn, args, kwargs = pickle.loads(payload)
+            if self.app is None:
+                result = fn(*args, **kwargs)
+            else:
+                with self.app.app_context():
+                    result = fn(*args, **kwargs)
+        except Exception as exc:
+            return _dump_outcome(False, exc)
+        return _dump_outcome(True, result)
+
+
+def load_app(app):
+    """Import a Flask application, or call an application factory, given as
+    ``'module:name'``."""
+    from flask import Flask
+
+    app = import_string(app)
+    if not isinstance(app, Flask) and callable(app):
+        app = app()
+    return app
+
+
+def main(argv=None):
+    """The ``flask-executor-worker`` command."""
+    parser = argparse.ArgumentParser(
+        prog='flask-executor-worker',
+        description='Run tasks for a Flask-Executor distributed executor.'
+    )
+    parser.add_argument('app', help="the application or factory, as 'module:name'")
+    parser.add_argument('--executor', default='', help='the name of the executor')
+    parser.add_argument('--broker', help="overrides the app's EXECUTOR_BROKER_URL")
+    parser.add_argument('--threads', type=int, default=1, help='tasks to run at once')
+    parser.add_argument('--burst', action='store_true', help='exit once the queue is empty')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    app = load_app(args.app)
+    executor = app.extensions[args.executor + 'executor']
+    worker = executor.worker(app, broker=args.broker)
+    run_worker(worker, threads=args.threads, burst=args.burst)
+
+
+def run_worker(worker, threads=1, burst=False):
+    """Run ``worker`` on ``threads`` threads until interrupted or, with
+    ``burst``, until its queue is empty."""
+    LOGGER.info('Worker %s taking tasks from queue %r', worker.name, worker.queue)
+    runners = [threading.Thread(target=worker.run, args=(burst,)) for _ in range(threads)]
+    for runner in runners:
+        runner.start()
+    try:
+        for runner in runners:
+            while runner.is_alive():
+                runner.join(0.5)
+    except KeyboardInterrupt:
+        LOGGER.info('Worker %s finishing running tasks', worker.name)
+        worker.stop()
+        for runner in runners:
+            runner.join()
+
+
+if __name__ == '__main__':
+    main()
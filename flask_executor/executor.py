@@ -1,12 +1,58 @@
+import collections
 import concurrent.futures
 import contextvars
 import copy
+import functools
+import inspect
+import logging
+import os
 import re
+import sys
+import threading
+import time
+import traceback
+import weakref
 
 from flask import copy_current_request_context, current_app, g
+from werkzeug.utils import import_string
 
-from flask_executor.futures import FutureCollection, FutureProxy
-from flask_executor.helpers import InstanceProxy, str2bool
+from flask_executor.admission import (
+    PRIORITIES, AdmissionController, ExecutorOverloaded, overloaded_handler
+)
+from flask_executor.futures import (
+    RETENTION_MODES, DoneCallbacks, FutureCollection, FutureProxy, spill_result
+)
+from flask_executor.helpers import (
+    InstanceProxy, cpu_count, gil_enabled, interpreter_pool, str2bool
+)
+from flask_executor.retry import RetryPolicy
+from flask_executor.taskgroup import TaskGroup, current_task_group
+from flask_executor.tracing import SpanHooks, task_name, traced, tracked
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Disables retries for tasks that would otherwise inherit a policy
+NO_RETRY = RetryPolicy(max_attempts=1)
+# Executor types whose workers are sent jobs by name, as they can't share the
+# decorated functions
+BY_NAME_TYPES = ('interpreter', 'distributed')
+
+
+def _work_stealing(pool):
+    # The module is only imported by work stealing executors
+    module = sys.modules.get('flask_executor.workstealing')
+    return module is not None and isinstance(pool, module.WorkStealingExecutor)
+
+
+def _on_threads(pool):
+    # Whether tasks run on threads of this process, and so can be given
+    # copies of the Flask contexts. Interpreter pools are thread pools too,
+    # but run each task in an interpreter of its own.
+    if isinstance(pool, concurrent.futures.ThreadPoolExecutor):
+        pool_class = interpreter_pool()
+        return pool_class is None or not isinstance(pool, pool_class)
+    return _work_stealing(pool)
 
 
 def get_current_app_context():
@@ -22,6 +68,7 @@ def push_app_context(fn):
     app = current_app._get_current_object()
     _g = copy.copy(g)
 
+    @functools.wraps(fn)
     def wrapper(*args, **kwargs):
         with app.app_context():
             ctx = get_current_app_context()
@@ -31,31 +78,182 @@ def push_app_context(fn):
     return wrapper
 
 
+def copy_context_vars(fn):
+    ctx = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        # A context can only be entered by one thread at a time, and the
+        # same callable may run on several workers at once
+        return ctx.copy().run(fn, *args, **kwargs)
+
+    return wrapper
+
+
 def propagate_exceptions_callback(future):
     exc = future.exception()
     if exc:
         raise exc
 
 
+def _run_job(module, qualname, *args, **kwargs):
+    # Resolves a job by name in the worker process, so that functions
+    # decorated with Executor.job can be sent to a process pool
+    obj = import_string(module)
+    for name in qualname.split('.'):
+        obj = getattr(obj, name)
+    fn = obj.fn if isinstance(obj, ExecutorJob) else obj
+    return fn(*args, **kwargs)
+
+
+DroppedTask = collections.namedtuple('DroppedTask', ['fn', 'args', 'kwargs', 'future'])
+DroppedTask.__doc__ = """A task that had not completed when an executor was drained."""
+
+
+DrainReport = collections.namedtuple('DrainReport', ['completed', 'dropped', 'abandoned'])
+DrainReport.__doc__ = """The outcome of :meth:`Executor.drain`. ``completed`` is the number of
+tasks that finished while draining, ``dropped`` lists the :class:`DroppedTask`
+instances that were cancelled before they started and ``abandoned`` lists
+the tasks that were still running when the timeout expired."""
+
+
+class _Task:
+    """Book-keeping for a task whose Future is resolved by the executor
+    rather than by the underlying pool, e.g. because it is rate limited or
+    may be retried."""
+
+    __slots__ = ('future', 'fn', 'args', 'kwargs', 'job', 'retry', 'pool', 'attempt',
+                 'timer', 'source', 'holding', 'reserved')
+
+    def __init__(self, future, fn, args, kwargs, job=None, retry=None, pool=None):
+        self.future = future
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.job = job
+        self.retry = retry
+        self.pool = pool
+        self.attempt = 0
+        self.timer = None
+        self.source = None
+        self.holding = False
+        self.reserved = False
+
+
 class ExecutorJob:
     """Wraps a function with an executor so to allow the wrapped function to
-    submit itself directly to the executor."""
+    submit itself directly to the executor.
+
+    :param executor: The :class:`Executor` the job submits itself to.
+    :param fn: The wrapped callable.
+    :param rate: An optional rate limit for this job, e.g. ``'100/s'``. See
+                 :func:`flask_executor.ratelimit.parse_rate`.
+    :param burst: The number of tasks that may start back to back before
+                  ``rate`` applies.
+    :param retry: An optional :class:`~flask_executor.retry.RetryPolicy`, or
+                  a maximum number of attempts, for failed tasks.
+    :param kind: ``'io'``, ``'cpu'`` or ``'auto'``. On a ``'hybrid'``
+                 executor, ``'cpu'`` jobs run in the process pool and
+                 ``'auto'`` jobs are routed by their observed CPU usage.
+    :param priority: ``'low'``, ``'normal'`` or ``'high'``. Low priority
+                     tasks are shed first when the executor is overloaded,
+                     and high priority tasks are never rejected.
+    :param weight: The number of workers each task counts as.
+    :param resources: A dict of the amount of each of the executor's
+                      ``EXECUTOR_RESOURCES`` that each task uses.
+    :param partition_key: A callable that is passed each task's arguments
+                          and returns the key of the partition it runs in.
+    """
+
+    #: Number of thread runs observed before an ``'auto'`` job is routed.
+    AUTO_SAMPLES = 5
+    #: CPU time to wall time ratio above which ``'auto'`` jobs use processes.
+    AUTO_CPU_RATIO = 0.75
 
-    def __init__(self, executor, fn):
+    def __init__(self, executor, fn, rate=None, burst=None, retry=None, kind='io',
+                 priority='normal', weight=None, resources=None, partition_key=None):
+        if kind not in ('io', 'cpu', 'auto'):
+            raise ValueError("{} is not a valid job kind.".format(kind))
+        if priority not in PRIORITIES:
+            raise ValueError("{} is not a valid job priority.".format(priority))
+        needs = dict(resources or {})
+        if weight is not None:
+            needs['workers'] = weight
+        for name, amount in needs.items():
+            if amount <= 0:
+                raise ValueError("{} is not a valid amount of {!r}.".format(amount, name))
         self.executor = executor
         self.fn = fn
+        self.rate_limit = None
+        if rate is not None:
+            # Imported here, as most jobs aren't rate limited
+            from flask_executor.ratelimit import TokenBucket
+
+            self.rate_limit = TokenBucket(rate, burst)
+        self.retry = RetryPolicy.coerce(retry)
+        self.kind = kind
+        self.priority = priority
+        self.needs = needs
+        self.partition_key = partition_key
+        self.cpu_time = 0.0
+        self.wall_time = 0.0
+        self.samples = 0
+
+    @property
+    def cpu_bound(self):
+        """Whether tasks for this job should run in a process pool."""
+        if self.kind == 'auto':
+            return self.samples >= self.AUTO_SAMPLES \
+                and self.cpu_time > self.AUTO_CPU_RATIO * self.wall_time
+        return self.kind == 'cpu'
+
+    def _measure(self, fn):
+        # Records CPU and wall time of thread runs to learn the job's routing
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            wall_start = time.perf_counter()
+            cpu_start = time.thread_time()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.cpu_time += time.thread_time() - cpu_start
+                self.wall_time += time.perf_counter() - wall_start
+                self.samples += 1
+
+        return wrapper
 
     def submit(self, *args, **kwargs):
-        future = self.executor.submit(self.fn, *args, **kwargs)
+        future = self.executor._submit(self.fn, args, kwargs, job=self)
         return future
 
     def submit_stored(self, future_key, *args, **kwargs):
-        future = self.executor.submit_stored(future_key, self.fn, *args, **kwargs)
+        future = self.executor._submit(self.fn, args, kwargs, job=self, stored=True)
+        self.executor.futures.add(future_key, future)
+        return future
+
+    def submit_at(self, when, *args, **kwargs):
+        from flask_executor.scheduler import to_monotonic
+
+        future = self.executor._submit(self.fn, args, kwargs, job=self, when=to_monotonic(when))
         return future
 
+    def submit_after(self, delay, *args, **kwargs):
+        from flask_executor.scheduler import to_seconds
+
+        when = time.monotonic() + to_seconds(delay)
+        future = self.executor._submit(self.fn, args, kwargs, job=self, when=when)
+        return future
+
+    def schedule_every(self, interval, *args, **kwargs):
+        periodic_task = self.executor._schedule_every(interval, self.fn, args, kwargs, job=self)
+        return periodic_task
+
     def map(self, *iterables, **kwargs):
-        results = self.executor.map(self.fn, *iterables, **kwargs)
-        return results
+        if self.rate_limit is None and self.retry is None and self.kind == 'io' \
+                and self.priority == 'normal' and not self.needs and self.partition_key is None \
+                and self.executor._executor_type not in BY_NAME_TYPES:
+            return self.executor.map(self.fn, *iterables, **kwargs)
+        return self.executor._map(self.fn, iterables, job=self, **kwargs)
 
 
 class Executor(InstanceProxy, concurrent.futures._base.Executor):
@@ -72,6 +270,31 @@ class Executor(InstanceProxy, concurrent.futures._base.Executor):
     def __init__(self, app=None, name=''):
         self.app = app
         self._default_done_callbacks = []
+        self._rate_limit = None
+        self._retry = None
+        self._callback_executor = None
+        self._process_pool = None
+        self._pool_factory = None
+        self._executor_type = None
+        self._scheduler = None
+        self._inflight = {}
+        self._waiting = {}
+        self._running = {}
+        self._periodic_tasks = weakref.WeakSet()
+        self._drain_callbacks = []
+        self._preload_hooks = []
+        self._draining = False
+        self._shutdown_timeout = None
+        self._spill_bytes = None
+        self._spill_dir = None
+        self._span_hooks = []
+        self._stream_buffer = 16
+        self._admission = None
+        self._resources = {}
+        self._budget = None
+        self._partitions = None
+        self._partitioner = None
+        self._lock = threading.Lock()
         self.futures = FutureCollection()
         if re.match(r'^(\w+)?$', name) is None:
             raise ValueError(
@@ -82,30 +305,161 @@ class Executor(InstanceProxy, concurrent.futures._base.Executor):
         self.EXECUTOR_TYPE = prefix + 'EXECUTOR_TYPE'
         self.EXECUTOR_MAX_WORKERS = prefix + 'EXECUTOR_MAX_WORKERS'
         self.EXECUTOR_FUTURES_MAX_LENGTH = prefix + 'EXECUTOR_FUTURES_MAX_LENGTH'
+        self.EXECUTOR_FUTURES_RETENTION = prefix + 'EXECUTOR_FUTURES_RETENTION'
         self.EXECUTOR_PROPAGATE_EXCEPTIONS = prefix + 'EXECUTOR_PROPAGATE_EXCEPTIONS'
         self.EXECUTOR_PUSH_APP_CONTEXT = prefix + 'EXECUTOR_PUSH_APP_CONTEXT'
+        self.EXECUTOR_COPY_CONTEXTVARS = prefix + 'EXECUTOR_COPY_CONTEXTVARS'
+        self.EXECUTOR_RATE_LIMIT = prefix + 'EXECUTOR_RATE_LIMIT'
+        self.EXECUTOR_RATE_LIMIT_BURST = prefix + 'EXECUTOR_RATE_LIMIT_BURST'
+        self.EXECUTOR_RETRY_MAX_ATTEMPTS = prefix + 'EXECUTOR_RETRY_MAX_ATTEMPTS'
+        self.EXECUTOR_RETRY_BACKOFF = prefix + 'EXECUTOR_RETRY_BACKOFF'
+        self.EXECUTOR_CALLBACK_WORKERS = prefix + 'EXECUTOR_CALLBACK_WORKERS'
+        self.EXECUTOR_SHUTDOWN_TIMEOUT = prefix + 'EXECUTOR_SHUTDOWN_TIMEOUT'
+        self.EXECUTOR_DRAIN_SIGNALS = prefix + 'EXECUTOR_DRAIN_SIGNALS'
+        self.EXECUTOR_PRELOAD = prefix + 'EXECUTOR_PRELOAD'
+        self.EXECUTOR_PROCESS_MAX_WORKERS = prefix + 'EXECUTOR_PROCESS_MAX_WORKERS'
+        self.EXECUTOR_RESULT_SPILL_BYTES = prefix + 'EXECUTOR_RESULT_SPILL_BYTES'
+        self.EXECUTOR_RESULT_SPILL_DIR = prefix + 'EXECUTOR_RESULT_SPILL_DIR'
+        self.EXECUTOR_MAX_INFLIGHT = prefix + 'EXECUTOR_MAX_INFLIGHT'
+        self.EXECUTOR_MAX_QUEUE_WAIT = prefix + 'EXECUTOR_MAX_QUEUE_WAIT'
+        self.EXECUTOR_SHED_RATIO = prefix + 'EXECUTOR_SHED_RATIO'
+        self.EXECUTOR_RETRY_AFTER = prefix + 'EXECUTOR_RETRY_AFTER'
+        self.EXECUTOR_STREAM_BUFFER = prefix + 'EXECUTOR_STREAM_BUFFER'
+        self.EXECUTOR_RESOURCES = prefix + 'EXECUTOR_RESOURCES'
+        self.EXECUTOR_PARTITIONS = prefix + 'EXECUTOR_PARTITIONS'
+        self.EXECUTOR_BROKER_URL = prefix + 'EXECUTOR_BROKER_URL'
+        self.EXECUTOR_BROKER_POLL_INTERVAL = prefix + 'EXECUTOR_BROKER_POLL_INTERVAL'
+        self.EXECUTOR_BROKER_LEASE = prefix + 'EXECUTOR_BROKER_LEASE'
 
         if app is not None:
             self.init_app(app)
 
     def init_app(self, app):
-        """Initialise application. This will also intialise the configured
-        executor type:
+        """Initialise application. This will also configure the executor
+        type, whose pool is created when the first task is submitted:
 
             * :class:`concurrent.futures.ThreadPoolExecutor`
             * :class:`concurrent.futures.ProcessPoolExecutor`
+            * :class:`concurrent.futures.ProcessPoolExecutor` with workers
+              forked once the application is loaded (``'prefork'``)
+            * A :class:`concurrent.futures.ThreadPoolExecutor` alongside a
+              :class:`concurrent.futures.ProcessPoolExecutor` for CPU bound
+              jobs (``'hybrid'``), or a second thread pool on free-threaded
+              builds of Python
+            * :class:`flask_executor.workstealing.WorkStealingExecutor`
+              (``'work_stealing'``)
+            * :class:`concurrent.futures.InterpreterPoolExecutor`, on Python
+              3.14 and later (``'interpreter'``)
+            * :class:`flask_executor.distributed.DistributedExecutor`, which
+              sends tasks through ``EXECUTOR_BROKER_URL`` to worker
+              processes (``'distributed'``)
+
+        Prefork workers are the exception, and are forked straight away. Use
+        :meth:`prestart` to create the pool and start its workers ahead of
+        the first task.
         """
-        app.config.setdefault(self.EXECUTOR_TYPE, 'thread')
+        executor_type = app.config.setdefault(self.EXECUTOR_TYPE, 'thread')
+        if executor_type not in ('thread', 'process', 'prefork', 'hybrid', 'work_stealing',
+                                 'interpreter', 'distributed'):
+            raise ValueError("{} is not a valid executor type.".format(executor_type))
+        if executor_type == 'interpreter' and interpreter_pool() is None:
+            raise ValueError("The interpreter executor type requires Python 3.14 or later.")
+        broker_url = app.config.setdefault(self.EXECUTOR_BROKER_URL, None)
+        if executor_type == 'distributed' and broker_url is None:
+            raise ValueError("The distributed executor type requires {}.".format(
+                self.EXECUTOR_BROKER_URL
+            ))
+        app.config.setdefault(self.EXECUTOR_BROKER_POLL_INTERVAL, 0.1)
+        app.config.setdefault(self.EXECUTOR_BROKER_LEASE, None)
         app.config.setdefault(self.EXECUTOR_PUSH_APP_CONTEXT, True)
+        app.config.setdefault(self.EXECUTOR_COPY_CONTEXTVARS, True)
         futures_max_length = app.config.setdefault(self.EXECUTOR_FUTURES_MAX_LENGTH, None)
         propagate_exceptions = app.config.setdefault(self.EXECUTOR_PROPAGATE_EXCEPTIONS, False)
         if futures_max_length is not None:
             self.futures.max_length = int(futures_max_length)
+        futures_retention = app.config.setdefault(self.EXECUTOR_FUTURES_RETENTION, 'full')
+        if futures_retention not in RETENTION_MODES:
+            raise ValueError("{} must be one of {}.".format(
+                self.EXECUTOR_FUTURES_RETENTION, ', '.join(RETENTION_MODES)
+            ))
+        self.futures.retention = futures_retention
         if str2bool(propagate_exceptions):
             self.add_default_done_callback(propagate_exceptions_callback)
-        self._self = self._make_executor(app)
+        rate_limit = app.config.setdefault(self.EXECUTOR_RATE_LIMIT, None)
+        rate_limit_burst = app.config.setdefault(self.EXECUTOR_RATE_LIMIT_BURST, None)
+        if rate_limit is not None:
+            from flask_executor.ratelimit import TokenBucket
+
+            self._rate_limit = TokenBucket(rate_limit, rate_limit_burst)
+        retry_max_attempts = app.config.setdefault(self.EXECUTOR_RETRY_MAX_ATTEMPTS, None)
+        retry_backoff = app.config.setdefault(self.EXECUTOR_RETRY_BACKOFF, 1.0)
+        if retry_max_attempts is not None:
+            self._retry = RetryPolicy(max_attempts=retry_max_attempts, backoff=retry_backoff)
+        callback_workers = app.config.setdefault(self.EXECUTOR_CALLBACK_WORKERS, None)
+        if callback_workers is not None and int(callback_workers) > 0:
+            self._callback_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=int(callback_workers),
+                thread_name_prefix='{}executor-callbacks'.format(self.name + '-' if self.name else '')
+            )
+        shutdown_timeout = app.config.setdefault(self.EXECUTOR_SHUTDOWN_TIMEOUT, None)
+        if shutdown_timeout is not None:
+            self._shutdown_timeout = float(shutdown_timeout)
+        spill_bytes = app.config.setdefault(self.EXECUTOR_RESULT_SPILL_BYTES, None)
+        if spill_bytes is not None:
+            self._spill_bytes = int(spill_bytes)
+        self._spill_dir = app.config.setdefault(self.EXECUTOR_RESULT_SPILL_DIR, None)
+        self._stream_buffer = int(app.config.setdefault(self.EXECUTOR_STREAM_BUFFER, 16))
+        self._resources = dict(app.config.setdefault(self.EXECUTOR_RESOURCES, None) or {})
+        self._budget = None
+        self._partitions = app.config.setdefault(self.EXECUTOR_PARTITIONS, None)
+        self._partitioner = None
+        max_inflight = app.config.setdefault(self.EXECUTOR_MAX_INFLIGHT, None)
+        max_queue_wait = app.config.setdefault(self.EXECUTOR_MAX_QUEUE_WAIT, None)
+        shed_ratio = app.config.setdefault(self.EXECUTOR_SHED_RATIO, 0.8)
+        retry_after = app.config.setdefault(self.EXECUTOR_RETRY_AFTER, 1.0)
+        if max_inflight is not None or max_queue_wait is not None:
+            self._admission = AdmissionController(
+                max_inflight, max_queue_wait, shed_ratio=shed_ratio, retry_after=retry_after
+            )
+            # A handler the application registered itself is left in place
+            if ExecutorOverloaded not in app.error_handler_spec[None][None]:
+                app.register_error_handler(ExecutorOverloaded, overloaded_handler)
+        drain_signals = app.config.setdefault(self.EXECUTOR_DRAIN_SIGNALS, None)
+        if drain_signals:
+            self.drain_on_signals(drain_signals)
+        self._draining = False
+        self._scheduler = None
+        self._process_pool = None
+        self._executor_type = executor_type
+        if executor_type == 'prefork':
+            self._self = self._make_executor(app)
+        else:
+            self._self = None
+            self._pool_factory = functools.partial(self._make_executor, app)
+        app.teardown_request(self._teardown_task_groups)
+        # Imported here, as the commands import this module
+        from flask_executor.cli import executor_cli
+
+        app.cli.add_command(executor_cli)
         app.extensions[self.name + 'executor'] = self
 
+    @property
+    def _self(self):
+        # Builds the pool on first use, so that processes which never submit
+        # a task don't pay for it
+        pool = InstanceProxy._self.fget(self)
+        if pool is None and self._pool_factory is not None:
+            with self._lock:
+                pool = InstanceProxy._self.fget(self)
+                if pool is None and self._pool_factory is not None:
+                    pool = self._pool_factory()
+                    InstanceProxy._self.fset(self, pool)
+        return pool
+
+    @_self.setter
+    def _self(self, pool):
+        InstanceProxy._self.fset(self, pool)
+
     def _make_executor(self, app):
         executor_max_workers = app.config.setdefault(self.EXECUTOR_MAX_WORKERS, None)
         if executor_max_workers is not None:
@@ -115,18 +469,503 @@ class Executor(InstanceProxy, concurrent.futures._base.Executor):
             _executor = concurrent.futures.ThreadPoolExecutor
         elif executor_type == 'process':
             _executor = concurrent.futures.ProcessPoolExecutor
+        elif executor_type == 'prefork':
+            return self._make_prefork_executor(app, executor_max_workers)
+        elif executor_type == 'work_stealing':
+            from flask_executor.workstealing import WorkStealingExecutor
+
+            _executor = WorkStealingExecutor
+        elif executor_type == 'interpreter':
+            # Tasks are CPU bound, so more interpreters than CPUs don't help
+            _executor = interpreter_pool()
+            if executor_max_workers is None:
+                executor_max_workers = cpu_count()
+        elif executor_type == 'distributed':
+            # Imported here, as only distributed executors need it
+            from flask_executor.distributed import DistributedExecutor, make_broker
+
+            return DistributedExecutor(
+                make_broker(app.config[self.EXECUTOR_BROKER_URL],
+                            lease=app.config[self.EXECUTOR_BROKER_LEASE]),
+                queue=self.name or 'default',
+                poll_interval=float(app.config[self.EXECUTOR_BROKER_POLL_INTERVAL])
+            )
+        elif executor_type == 'hybrid':
+            process_max_workers = app.config.setdefault(self.EXECUTOR_PROCESS_MAX_WORKERS, None)
+            if process_max_workers is not None:
+                process_max_workers = int(process_max_workers)
+            if gil_enabled():
+                self._process_pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=process_max_workers
+                )
+            else:
+                # Free-threaded builds run CPU bound jobs on threads in
+                # parallel, without the cost of pickling them to processes
+                self._process_pool = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=process_max_workers or cpu_count(),
+                    thread_name_prefix='{}executor-cpu'.format(
+                        self.name + '-' if self.name else ''
+                    )
+                )
+            _executor = concurrent.futures.ThreadPoolExecutor
         else:
             raise ValueError("{} is not a valid executor type.".format(executor_type))
         return _executor(max_workers=executor_max_workers)
 
+    def _make_prefork_executor(self, app, max_workers):
+        # Imported here, as most executors never need them
+        import gc
+        import multiprocessing
+
+        try:
+            mp_context = multiprocessing.get_context('fork')
+        except ValueError:
+            raise ValueError(
+                "The prefork executor type requires the fork start method, "
+                "which is not available on this platform."
+            )
+        preload = app.config.setdefault(self.EXECUTOR_PRELOAD, None)
+        if preload is None:
+            preload = []
+        elif isinstance(preload, str) or callable(preload):
+            preload = [preload]
+        hooks = [import_string(hook) if isinstance(hook, str) else hook for hook in preload]
+        with app.app_context():
+            for hook in hooks + self._preload_hooks:
+                hook()
+        # Move everything loaded so far out of the collector's reach, so
+        # that collections in the workers don't write to, and copy, pages
+        # shared with the parent
+        gc.collect()
+        if hasattr(gc, 'freeze'):
+            gc.freeze()
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=mp_context
+        )
+        # Fork the workers now, while the parent is warm, rather than on the
+        # first submitted task
+        executor.submit(os.getpid).result()
+        return executor
+
+    def preload(self, fn):
+        """Decorator. Registers a callable that loads heavy, read-only data
+        (models, lookup tables, compiled templates) before the workers of a
+        ``'prefork'`` executor are forked. Hooks run once, in the parent
+        process and inside an application context, when :meth:`init_app` is
+        called, so they must be registered before it. Workers then share
+        the loaded data with the parent copy-on-write.
+
+        Hooks can also be configured with ``EXECUTOR_PRELOAD``, as a callable,
+        an import string such as ``'myapp.models:load'`` or a list of either.
+
+        Example::
+
+            executor = Executor()
+
+            @executor.preload
+            def load_model():
+                models.classifier = joblib.load('classifier.pkl')
+
+            executor.init_app(app)
+        """
+        self._preload_hooks.append(fn)
+        return fn
+
+    def _help_until(self, future, timeout=None):
+        # Lets a work stealing worker that waits on a future run other tasks
+        # in the meantime. Returns the time left of the timeout.
+        pool = InstanceProxy._self.fget(self)
+        if _work_stealing(pool):
+            return pool.help_until(future, timeout)
+        return timeout
+
     def _prepare_fn(self, fn, force_copy=False):
-        if isinstance(self._self, concurrent.futures.ThreadPoolExecutor) \
+        if _on_threads(self._self) \
             or force_copy:
+            # Callbacks, which are prepared with force_copy, aren't traced
+            if not force_copy:
+                fn = tracked(fn, self._running)
+                if self._span_hooks:
+                    fn = traced(fn, tuple(self._span_hooks))
             fn = copy_current_request_context(fn)
             if current_app.config[self.EXECUTOR_PUSH_APP_CONTEXT]:
                 fn = push_app_context(fn)
+            if current_app.config[self.EXECUTOR_COPY_CONTEXTVARS]:
+                fn = copy_context_vars(fn)
         return fn
 
+    def prestart(self, workers=None):
+        """Creates the executor's pool, if no task has created it yet, and
+        starts its workers now rather than as tasks arrive. Call this from
+        a long-lived process's startup code so that the first requests
+        don't pay for starting workers; short-lived processes that may
+        never submit a task can leave the pool to be created on demand.
+
+        :param workers: The number of threads to start in a thread pool,
+                        defaulting to its maximum. Process pools start all
+                        of their workers.
+        """
+        pool = self._self
+        if _on_threads(pool):
+            if workers is None:
+                workers = pool._max_workers
+            workers = min(int(workers), pool._max_workers)
+            # A thread pool only starts a thread when no idle thread can take
+            # a task, so tasks that wait for one another start one each
+            barrier = threading.Barrier(workers + 1)
+            for _ in range(workers):
+                pool.submit(barrier.wait, 1)
+            try:
+                barrier.wait(1)
+            except threading.BrokenBarrierError:
+                pass
+        elif self._executor_type != 'distributed':
+            # Distributed workers are separate processes, started with
+            # flask-executor-worker
+            pool.submit(os.getpid).result()
+        if self._process_pool is not None:
+            self._process_pool.submit(os.getpid).result()
+
+    def worker(self, app, broker=None):
+        """Returns a :class:`~flask_executor.distributed.Worker` that runs
+        the tasks of a ``'distributed'`` executor inside ``app``'s context.
+        The ``flask-executor-worker`` command uses this; call it to run
+        workers some other way.
+
+        :param app: The Flask application tasks run in.
+        :param broker: A broker, or broker URL, to use instead of
+                       ``EXECUTOR_BROKER_URL``.
+        """
+        if self._executor_type != 'distributed':
+            raise TypeError("Only distributed executors have workers")
+        from flask_executor.distributed import Worker, make_broker
+
+        pool = self._self
+        if broker is None:
+            broker = pool.broker
+        else:
+            broker = make_broker(broker, lease=app.config.get(self.EXECUTOR_BROKER_LEASE))
+        return Worker(broker, queue=pool.queue, app=app, poll_interval=pool.poll_interval)
+
+    @property
+    def scheduler(self):
+        """The :class:`~flask_executor.scheduler.Scheduler` holding tasks
+        that are waiting to be handed to the executor. It is created, along
+        with its thread, the first time a task has to wait."""
+        if self._scheduler is None:
+            from flask_executor.scheduler import Scheduler
+
+            with self._lock:
+                if self._scheduler is None:
+                    self._scheduler = Scheduler(
+                        name='{}executor-scheduler'.format(self.name + '-' if self.name else '')
+                    )
+        return self._scheduler
+
+    @staticmethod
+    def _reserve(bucket):
+        # Returns the monotonic time of the bucket's next slot, or None if
+        # the task can be handed to the executor immediately
+        now = time.monotonic()
+        when = bucket.reserve(now)
+        return when if when > now else None
+
+    def _needs_task(self, job=None):
+        return self._rate_limit is not None or self._retry is not None or (
+            job is not None and (job.rate_limit is not None or job.retry is not None
+                                 or bool(job.needs))
+        )
+
+    @property
+    def budget(self):
+        """The :class:`~flask_executor.resources.ResourceBudget` that jobs
+        declaring a ``weight`` or ``resources`` draw from. It holds
+        ``EXECUTOR_RESOURCES`` and, unless they include ``'workers'``, as
+        many workers as the pool has."""
+        if self._budget is None:
+            capacities = dict(self._resources)
+            if 'workers' not in capacities:
+                max_workers = getattr(self._self, '_max_workers', None)
+                if max_workers is not None:
+                    capacities['workers'] = max_workers
+            from flask_executor.resources import ResourceBudget
+
+            with self._lock:
+                if self._budget is None:
+                    self._budget = ResourceBudget(capacities)
+        return self._budget
+
+    @property
+    def partitioner(self):
+        """The :class:`~flask_executor.partition.Partitioner` that runs
+        partitioned tasks on ``EXECUTOR_PARTITIONS`` lane threads of its own,
+        or as many as the pool has workers. Only thread based executors can
+        run partitioned tasks."""
+        if self._partitioner is None:
+            pool = self._self
+            if not _on_threads(pool):
+                raise TypeError("Only executors that run tasks on threads can partition them")
+            from flask_executor.partition import Partitioner
+
+            with self._lock:
+                if self._partitioner is None:
+                    self._partitioner = Partitioner(
+                        self._partitions or pool._max_workers,
+                        name='{}executor-partition'.format(self.name + '-' if self.name else '')
+                    )
+        return self._partitioner
+
+    def _release(self, task):
+        if task.holding:
+            task.holding = False
+            self.budget.release(task.job.needs)
+
+    def _prepare_job_fn(self, fn, job=None):
+        # Returns the callable to submit and the pool to submit it to. On a
+        # hybrid executor CPU bound jobs go to the process pool, by name,
+        # since the decorated module attribute is the job rather than fn.
+        # Interpreter and distributed executors send every job by name.
+        pool = self._self
+        if self._executor_type in BY_NAME_TYPES and job is not None:
+            return functools.partial(_run_job, job.fn.__module__, job.fn.__qualname__), pool
+        if self._process_pool is not None and job is not None:
+            if job.cpu_bound and _on_threads(self._process_pool):
+                # Without a GIL, CPU bound jobs run on threads of their own
+                return self._prepare_fn(fn), self._process_pool
+            if job.cpu_bound:
+                return (functools.partial(_run_job, job.fn.__module__, job.fn.__qualname__),
+                        self._process_pool)
+            if job.kind == 'auto':
+                return self._prepare_fn(job._measure(fn)), pool
+        return self._prepare_fn(fn), pool
+
+    def _submit(self, fn, args, kwargs, job=None, when=None, retry=None, stored=False,
+                partition=None):
+        stream = None
+        if not stored and inspect.isgeneratorfunction(fn):
+            # Imported here, as only generator functions need it
+            from flask_executor.streaming import ResultStream, streamed
+
+            stream = ResultStream(self._stream_buffer)
+            fn = streamed(stream, fn)
+            # Chunks can't be taken back once consumed, so streams are
+            # never retried
+            if retry is not None or self._retry is not None \
+                    or (job is not None and job.retry is not None):
+                retry = NO_RETRY
+        fn, pool = self._prepare_job_fn(fn, job)
+        if stream is not None:
+            if not _on_threads(pool):
+                raise TypeError(
+                    "Only executors that run tasks on threads can stream the results "
+                    "of generator functions"
+                )
+            stream._attach(self._enqueue(fn, args, kwargs, job, when, retry, pool, partition))
+            return stream
+        if stored and self._spill_bytes is not None:
+            # Large results of stored futures may wait a long time to be
+            # popped, so they are kept on disk rather than in the Future
+            fn = functools.update_wrapper(
+                functools.partial(spill_result, self._spill_bytes, self._spill_dir, fn), fn
+            )
+        return self._enqueue(fn, args, kwargs, job, when, retry, pool, partition)
+
+    def _enqueue(self, fn, args, kwargs, job=None, when=None, retry=None, pool=None,
+                 partition=None):
+        if self._draining:
+            raise RuntimeError('cannot schedule new futures after shutdown')
+        if self._admission is not None:
+            # Tasks still waiting in the executor, e.g. delayed ones, don't
+            # load the pool
+            self._admission.admit(
+                len(self._inflight) - len(self._waiting),
+                job.priority if job is not None else 'normal'
+            )
+        if job is not None and job.needs:
+            self.budget.check(job.needs)
+        if pool is None:
+            pool = self._self
+        group = current_task_group(self)
+        hold = group is not None and group.after_response
+        if partition is None and job is not None and job.partition_key is not None:
+            partition = job.partition_key(*args, **kwargs)
+        if partition is not None:
+            # Tasks that wait elsewhere, or run again, would lose their place
+            # in the partition
+            if when is not None or retry is not None or hold or self._needs_task(job):
+                raise TypeError(
+                    "Partitioned tasks can't be delayed, rate limited, retried, held "
+                    "until after the response or given resources"
+                )
+            future = self.partitioner.submit(partition, self._timed(fn, pool), *args, **kwargs)
+        elif when is None and retry is None and not hold and not self._needs_task(job):
+            future = pool.submit(self._timed(fn, pool), *args, **kwargs)
+        else:
+            future = concurrent.futures.Future()
+            if retry is None:
+                retry = job.retry if job is not None and job.retry is not None else self._retry
+            task = _Task(future, fn, args, kwargs, job=job, retry=retry, pool=pool)
+            future.add_done_callback(lambda future: self._task_cancelled(task))
+            self._waiting[future] = task
+            if not (hold and group._hold(task, when)):
+                self._start(task, when)
+        self._inflight[future] = (fn, args, kwargs)
+        future.add_done_callback(self._untrack)
+        callbacks = None
+        if self._default_done_callbacks:
+            callbacks = DoneCallbacks(self, self._default_done_callbacks, self._callback_executor)
+            future.add_done_callback(callbacks)
+        future = FutureProxy(future, self, callbacks)
+        if group is not None:
+            group.futures.append(future)
+        return future
+
+    def _start(self, task, when=None):
+        # Tasks that are already due are admitted in submission order,
+        # rather than by deadlines that differ only by clock jitter
+        if when is None or when <= time.monotonic():
+            self._admit(task)
+        else:
+            task.timer = self.scheduler.call_at(when, self._admit, task)
+
+    def _timed(self, fn, pool):
+        # Measures how long tasks wait for a thread, for admission control
+        if self._admission is None or self._admission.max_queue_wait is None \
+                or not _on_threads(pool):
+            return fn
+        return self._admission.timed(fn)
+
+    def _untrack(self, future):
+        self._inflight.pop(future, None)
+        self._waiting.pop(future, None)
+
+    def _task_cancelled(self, task):
+        # Drop any pending timer, and pull the task from the pool's queue or
+        # its resource budget, as soon as its future is cancelled
+        if task.future.cancelled():
+            if task.timer is not None:
+                task.timer.cancel()
+            if task.source is not None:
+                task.source.cancel()
+            if task.job is not None and task.job.needs:
+                self.budget.discard(task)
+
+    def _admit(self, task):
+        # Tasks only take their rate limit slot once they are otherwise due
+        # to start, and wait in the scheduler rather than in a worker until
+        # that slot comes up
+        if task.future.cancelled():
+            return
+        job_limit = task.job.rate_limit if task.job is not None else None
+        if job_limit is not None and not task.reserved:
+            # The job's own slot comes first, and the executor's is only
+            # taken once that is due, so that tasks of a throttled job don't
+            # use up the executor's slots while they wait
+            task.reserved = True
+            when = self._reserve(job_limit)
+            if when is not None:
+                task.timer = self.scheduler.call_at(when, self._admit, task)
+                return
+        when = self._reserve(self._rate_limit) if self._rate_limit is not None else None
+        if when is None:
+            self._dispatch(task)
+        else:
+            task.timer = self.scheduler.call_at(when, self._dispatch, task)
+
+    def _dispatch(self, task):
+        if task.future.done():
+            self._release(task)
+            return
+        if task.job is not None and task.job.needs and not task.holding:
+            # Tasks whose resources are in use wait in the budget, which
+            # dispatches them once enough has been released
+            if not self.budget.acquire(task, task.job.needs,
+                                       functools.partial(self._resources_acquired, task)):
+                return
+            task.holding = True
+        task.attempt += 1
+        # Each attempt takes a rate limit slot of its own
+        task.reserved = False
+        try:
+            if _on_threads(task.pool):
+                source = task.pool.submit(self._timed(self._run_attempt, task.pool), task)
+            else:
+                source = task.pool.submit(task.fn, *task.args, **task.kwargs)
+        except BaseException as exc:
+            self._release(task)
+            self._set_outcome(task, exc=exc)
+        else:
+            task.source = source
+            self._waiting.pop(task.future, None)
+            source.add_done_callback(lambda source: self._task_done(task, source))
+
+    def _resources_acquired(self, task):
+        task.holding = True
+        self._dispatch(task)
+
+    @staticmethod
+    def _run_attempt(task):
+        # The task's future stays pending, and can be cancelled, until the
+        # first attempt actually starts on a worker
+        if not task.future.running() and not task.future.set_running_or_notify_cancel():
+            raise concurrent.futures.CancelledError()
+        return task.fn(*task.args, **task.kwargs)
+
+    @staticmethod
+    def _set_outcome(task, result=None, exc=None):
+        future = task.future
+        if future.done():
+            return
+        if not future.running() and not future.set_running_or_notify_cancel():
+            return
+        if exc is not None:
+            future.set_exception(exc)
+        else:
+            future.set_result(result)
+
+    def _task_done(self, task, source):
+        self._release(task)
+        if task.future.done():
+            return
+        if source.cancelled():
+            if not task.future.cancel():
+                self._set_outcome(task, exc=concurrent.futures.CancelledError())
+            return
+        exc = source.exception()
+        if exc is None:
+            self._set_outcome(task, result=source.result())
+        elif task.retry is not None and task.retry.should_retry(task.attempt, exc) \
+                and not self._draining:
+            self._waiting[task.future] = task
+            try:
+                task.timer = self.scheduler.call_later(
+                    task.retry.delay(task.attempt), self._admit, task
+                )
+            except RuntimeError:
+                self._set_outcome(task, exc=exc)
+        else:
+            self._set_outcome(task, exc=exc)
+
+    def _map(self, fn, iterables, job=None, timeout=None, chunksize=1):
+        fn, pool = self._prepare_job_fn(fn, job)
+        if timeout is not None:
+            end_time = timeout + time.monotonic()
+        fs = [self._enqueue(fn, args, {}, job, pool=pool) for args in zip(*iterables)]
+
+        def result_iterator():
+            try:
+                fs.reverse()
+                while fs:
+                    if timeout is None:
+                        yield fs.pop().result()
+                    else:
+                        yield fs.pop().result(end_time - time.monotonic())
+            finally:
+                for future in fs:
+                    future.cancel()
+
+        return result_iterator()
+
     def submit(self, fn, *args, **kwargs):
         r"""Schedules the callable, fn, to be executed as fn(\*args \**kwargs)
         and returns a :class:`~flask_executor.futures.FutureProxy` object, a
@@ -152,6 +991,37 @@ class Executor(InstanceProxy, concurrent.futures._base.Executor):
             future = executor.submit(pow, 323, 1235)
             print(future.result())
 
+        Generator functions submitted to a thread based executor return a
+        :class:`~flask_executor.streaming.ResultStream` instead, whose chunks
+        can be consumed while the generator runs::
+
+            for chunk in executor.submit(export_rows, query):
+                ...
+
+        :param fn: The callable to be executed.
+        :param \*args: A list of positional parameters used with
+                       the callable.
+        :param \**kwargs: A dict of named parameters used with
+                          the callable.
+
+        :rtype: flask_executor.FutureProxy or
+                flask_executor.streaming.ResultStream
+        """
+        return self._submit(fn, args, kwargs)
+
+    def submit_with_retry(self, retry, fn, *args, **kwargs):
+        r"""Submits the callable like :meth:`Executor.submit`, retrying it
+        according to ``retry`` when it raises. Retries are re-submitted by
+        the executor's scheduler after their backoff has elapsed, and the
+        returned Future only resolves on the final success or failure.
+
+        Example::
+
+            policy = RetryPolicy(max_attempts=5, retry_on=(IOError,))
+            future = executor.submit_with_retry(policy, urlopen, url)
+
+        :param retry: A :class:`~flask_executor.retry.RetryPolicy`, or a
+                      maximum number of attempts.
         :param fn: The callable to be executed.
         :param \*args: A list of positional parameters used with
                        the callable.
@@ -160,11 +1030,104 @@ class Executor(InstanceProxy, concurrent.futures._base.Executor):
 
         :rtype: flask_executor.FutureProxy
         """
-        fn = self._prepare_fn(fn)
-        future = self._self.submit(fn, *args, **kwargs)
-        for callback in self._default_done_callbacks:
-            future.add_done_callback(callback)
-        return FutureProxy(future, self)
+        return self._submit(fn, args, kwargs, retry=RetryPolicy.coerce(retry))
+
+    def submit_at(self, when, fn, *args, **kwargs):
+        r"""Schedules the callable, fn, to be executed as fn(\*args \**kwargs)
+        at the wall clock time ``when`` and returns a
+        :class:`~flask_executor.futures.FutureProxy` object. The application
+        and request contexts are captured when the task is scheduled.
+
+        Pending tasks wait in the executor's
+        :class:`~flask_executor.scheduler.Scheduler`, a single timer thread,
+        rather than in a worker. They can be cancelled with
+        :meth:`~concurrent.futures.Future.cancel` until they start.
+
+        Example::
+
+            tomorrow = datetime.now() + timedelta(days=1)
+            executor.submit_at(tomorrow, send_reminder, user.email)
+
+        :param when: A :class:`datetime.datetime` or a Unix timestamp.
+        :param fn: The callable to be executed.
+        :param \*args: A list of positional parameters used with
+                       the callable.
+        :param \**kwargs: A dict of named parameters used with
+                          the callable.
+
+        :rtype: flask_executor.FutureProxy
+        """
+        from flask_executor.scheduler import to_monotonic
+
+        return self._submit(fn, args, kwargs, when=to_monotonic(when))
+
+    def submit_after(self, delay, fn, *args, **kwargs):
+        r"""Schedules the callable, fn, to be executed as fn(\*args \**kwargs)
+        once ``delay`` has elapsed. See :meth:`Executor.submit_at`.
+
+        Example::
+
+            executor.submit_after(30, send_email, recipient, subject, body)
+
+        :param delay: The delay in seconds or as a
+                      :class:`datetime.timedelta`.
+        :param fn: The callable to be executed.
+        :param \*args: A list of positional parameters used with
+                       the callable.
+        :param \**kwargs: A dict of named parameters used with
+                          the callable.
+
+        :rtype: flask_executor.FutureProxy
+        """
+        from flask_executor.scheduler import to_seconds
+
+        return self._submit(fn, args, kwargs, when=time.monotonic() + to_seconds(delay))
+
+    def schedule_every(self, interval, fn, *args, **kwargs):
+        r"""Submits the callable, fn, to the executor every ``interval``,
+        starting one interval from now, and returns a
+        :class:`~flask_executor.scheduler.PeriodicTask` handle that can be
+        used to cancel further runs. The application and request contexts
+        are captured once, when the task is scheduled.
+
+        A run is skipped if the previous one is still in progress, and the
+        Future of the latest run is available as
+        :attr:`PeriodicTask.future <flask_executor.scheduler.PeriodicTask.future>`.
+
+        Example::
+
+            cleanup = executor.schedule_every(timedelta(minutes=5), purge_sessions)
+            ...
+            cleanup.cancel()
+
+        :param interval: The interval in seconds or as a
+                         :class:`datetime.timedelta`.
+        :param fn: The callable to be executed.
+        :param \*args: A list of positional parameters used with
+                       the callable.
+        :param \**kwargs: A dict of named parameters used with
+                          the callable.
+
+        :rtype: flask_executor.scheduler.PeriodicTask
+        """
+        return self._schedule_every(interval, fn, args, kwargs)
+
+    def _schedule_every(self, interval, fn, args, kwargs, job=None):
+        fn, pool = self._prepare_job_fn(fn, job)
+        if self._draining:
+            raise RuntimeError('cannot schedule new futures after shutdown')
+        def submit():
+            try:
+                return self._enqueue(fn, args, kwargs, job, pool=pool)
+            except ExecutorOverloaded:
+                # The run is skipped, like one that overlaps the previous run
+                return None
+
+        from flask_executor.scheduler import PeriodicTask, to_seconds
+
+        periodic_task = PeriodicTask(self.scheduler, to_seconds(interval), submit)
+        self._periodic_tasks.add(periodic_task)
+        return periodic_task.start()
 
     def submit_stored(self, future_key, fn, *args, **kwargs):
         r"""Submits the callable using :meth:`Executor.submit` and stores the
@@ -179,6 +1142,12 @@ class Executor(InstanceProxy, concurrent.futures._base.Executor):
         See :class:`flask_executor.futures.FutureCollection` for more
         information on how to query futures in a collection.
 
+        When ``EXECUTOR_RESULT_SPILL_BYTES`` is set, results that are larger
+        than that once pickled are written to a temporary file instead of
+        being held by the Future, and are loaded again each time
+        :meth:`~flask_executor.futures.FutureProxy.result` is called. The
+        file is removed once the Future is popped and discarded.
+
         Example::
 
             @app.route('/start-task')
@@ -205,10 +1174,40 @@ class Executor(InstanceProxy, concurrent.futures._base.Executor):
 
         :rtype: concurrent.futures.Future
         """
-        future = self.submit(fn, *args, **kwargs)
+        future = self._submit(fn, args, kwargs, stored=True)
         self.futures.add(future_key, future)
         return future
 
+    def submit_partitioned(self, partition_key, fn, *args, **kwargs):
+        r"""Submits the callable like :meth:`Executor.submit`, in the
+        partition ``partition_key``. Tasks in the same partition run one at
+        a time, in the order they were submitted, and on the same thread,
+        so per-key state such as a tenant's cache stays warm and needs no
+        locking. Partitions are spread across the partitioner's lane threads
+        by hashing their keys, and new keys are routed away from lanes that
+        fall behind.
+
+        Jobs can declare a ``partition_key`` callable instead, which is
+        passed each task's arguments.
+
+        Example::
+
+            executor.submit_partitioned(tenant_id, apply_event, tenant_id, event)
+
+        Only thread based executors can run partitioned tasks, and they
+        can't be delayed, rate limited, retried or given resources.
+
+        :param partition_key: The key of the task's partition.
+        :param fn: The callable to be executed.
+        :param \*args: A list of positional parameters used with
+                       the callable.
+        :param \**kwargs: A dict of named parameters used with
+                          the callable.
+
+        :rtype: flask_executor.FutureProxy
+        """
+        return self._submit(fn, args, kwargs, partition=partition_key)
+
     def map(self, fn, *iterables, **kwargs):
         r"""Submits the callable, fn, and an iterable of arguments to the
         executor and returns the results inside a generator.
@@ -234,10 +1233,14 @@ class Executor(InstanceProxy, concurrent.futures._base.Executor):
                           executor's :meth:`~concurrent.futures.Executor.map`
                           method.
         """
+        if self._needs_task() or self._admission is not None \
+                or current_task_group(self) is not None:
+            return self._map(fn, iterables, **kwargs)
         fn = self._prepare_fn(fn)
         return self._self.map(fn, *iterables, **kwargs)
 
-    def job(self, fn):
+    def job(self, fn=None, rate=None, burst=None, retry=None, kind='io', priority='normal',
+            weight=None, resources=None, partition_key=None):
         """Decorator. Use this to transform functions into `ExecutorJob`
         instances that can submit themselves directly to the executor.
 
@@ -252,22 +1255,380 @@ class Executor(InstanceProxy, concurrent.futures._base.Executor):
 
             future = fib.submit(5)
             results = fib.map(range(1, 6))
+
+        The decorator can also be called with options that apply to every
+        submission of the job. Jobs that call rate limited services can
+        declare a ``rate`` (and optionally a ``burst``); tasks over the limit
+        wait in the executor's scheduler rather than blocking a worker::
+
+            @executor.job(rate='100/s', burst=10)
+            def call_api(item):
+                return requests.post(API_URL, json=item)
+
+        Jobs that submit subtasks and wait for them, such as a ``fib`` that
+        calls ``fib.submit`` recursively, can exhaust a fixed thread pool
+        with workers that are all waiting. With a ``'work_stealing'``
+        executor, a worker waiting on a result runs pending subtasks itself
+        instead.
+
+        Jobs can also be retried when they fail. Retries are re-submitted by
+        the scheduler after an exponential backoff, rather than sleeping in
+        a worker::
+
+            @executor.job(retry=RetryPolicy(max_attempts=5, retry_on=(IOError,)))
+            def fetch(url):
+                return urlopen(url).read()
+
+        :param rate: Maximum rate at which tasks for this job may start, as
+                     a number per second or a string such as ``'100/s'``,
+                     ``'30/m'`` or ``'1000/h'``.
+        :param burst: The number of tasks that may start back to back before
+                      ``rate`` applies. Defaults to 1.
+        :param retry: A :class:`~flask_executor.retry.RetryPolicy`, or a
+                      maximum number of attempts, for tasks that raise. The
+                      job's Future only resolves once the task succeeds or
+                      gives up.
+        :param kind: On a ``'hybrid'`` executor, ``'cpu'`` jobs run in the
+                     process pool and ``'io'`` jobs (the default) in the
+                     thread pool. ``'auto'`` jobs start on threads and move
+                     to processes once their CPU time is observed to
+                     dominate their wall time. CPU bound jobs must be
+                     decorated at module level so workers can import them.
+        :param priority: ``'low'``, ``'normal'`` (the default) or
+                         ``'high'``. When admission control is configured,
+                         low priority tasks are shed first as the executor
+                         nears its limits, and high priority tasks are
+                         always accepted.
+        :param weight: The number of workers each task counts as. The total
+                       weight of running tasks never exceeds the pool's
+                       workers, so heavy jobs are kept from running too many
+                       at once while lighter tasks use the remaining workers.
+        :param resources: A dict of the amount of each resource in
+                          ``EXECUTOR_RESOURCES`` that each task uses, e.g.
+                          ``{'memory': 2048}``. Tasks whose resources are in
+                          use wait, without holding a worker, until running
+                          tasks release enough.
+        :param partition_key: A callable that is passed each task's
+                              arguments and returns its partition's key, as
+                              for :meth:`submit_partitioned`.
         """
-        if isinstance(self._self, concurrent.futures.ProcessPoolExecutor):
+        if fn is None:
+            return lambda fn: self.job(fn, rate=rate, burst=burst, retry=retry, kind=kind,
+                                       priority=priority, weight=weight, resources=resources,
+                                       partition_key=partition_key)
+        if self._executor_type in ('process', 'prefork'):
             raise TypeError(
                 "Can't decorate {}: Executors that use multiprocessing "
                 "don't support decorators".format(fn)
             )
-        return ExecutorJob(executor=self, fn=fn)
+        return ExecutorJob(executor=self, fn=fn, rate=rate, burst=burst, retry=retry, kind=kind,
+                           priority=priority, weight=weight, resources=resources,
+                           partition_key=partition_key)
+
+    def task_group(self, timeout=None, after_response=False):
+        """Returns a :class:`~flask_executor.taskgroup.TaskGroup`, a context
+        manager that collects every task submitted to this executor inside
+        its block, so a view can fan out and then wait for, or cancel, all
+        of the results together::
+
+            @app.route('/dashboard')
+            def dashboard():
+                with executor.task_group(timeout=2) as group:
+                    orders = executor.submit(get_orders, user_id)
+                    alerts = executor.submit(get_alerts, user_id)
+                return render_template('dashboard.html', orders=orders.result(),
+                                       alerts=alerts.result())
+
+        Leaving the block waits up to ``timeout`` seconds for the group, then
+        cancels any of its tasks that haven't started. With
+        ``after_response`` the group's tasks are held until the response has
+        been sent instead, so work such as sending emails never delays it.
+        Groups are bound to the current request: tasks that are still held
+        or queued when the request ends with an unhandled exception are
+        cancelled.
+
+        :param timeout: Seconds to wait for the group's tasks when the block
+                        exits. ``None`` waits for all of them.
+        :param after_response: Hold the group's tasks until the response has
+                               been sent to the client.
+
+        :rtype: flask_executor.taskgroup.TaskGroup
+        """
+        return TaskGroup(self, timeout=timeout, after_response=after_response)
+
+    def _teardown_task_groups(self, exc=None):
+        for group in g.get('_executor_task_groups', ()):
+            if group.executor is self:
+                group._teardown(exc)
 
     def add_default_done_callback(self, fn):
         """Registers callable to be attached to all newly created futures. When a
-        callable is submitted to the executor,
-        :meth:`concurrent.futures.Future.add_done_callback` is called for every default
-        callable that has been set."
+        callable is submitted to the executor, a single
+        :class:`~flask_executor.futures.DoneCallbacks` dispatcher is attached to
+        its Future, which calls every default callable that has been set in the
+        order they were registered. Futures get no dispatcher at all while no
+        default callbacks are set.
+
+        Callbacks run on the worker that completed the Future, or on a
+        dedicated pool of ``EXECUTOR_CALLBACK_WORKERS`` threads if configured.
 
         :param fn: The callable to be added to the list of default done callbacks for new
                    Futures.
         """
 
         self._default_done_callbacks.append(fn)
+
+    def add_span_hooks(self, start=None, end=None, error=None):
+        """Registers hooks that run around every task submitted to a thread
+        based executor, so that time spent in the background can be
+        attributed to the request that caused it. Each hook is passed a
+        :class:`~flask_executor.tracing.TaskSpan`, and runs on the worker
+        inside the task's copies of the Flask contexts and of the
+        submitting thread's :mod:`contextvars`, which is where most tracing
+        libraries keep the current span.
+
+        Example::
+
+            def start(span):
+                span.data['span'] = tracer.start_span(span.name)
+                span.data['span'].set_attribute('queued', span.queued)
+
+            def error(span, exc):
+                span.data['span'].record_exception(exc)
+
+            def end(span):
+                span.data['span'].end()
+
+            executor.add_span_hooks(start=start, end=end, error=error)
+
+        ``error`` is called before ``end`` when a task raises. Hooks only
+        apply to tasks submitted after they are registered.
+
+        :param start: Called with the span before the task starts.
+        :param end: Called with the span after the task has finished.
+        :param error: Called with the span and the exception if the task
+                      raises.
+        """
+        self._span_hooks.append(SpanHooks(start, end, error))
+
+    def stats(self):
+        """Returns a snapshot of the executor's state, as used by the
+        ``flask executor`` commands and the debug blueprint: a dict of its
+        ``name``, ``type``, ``max_workers`` (``None`` until the pool has
+        been created), the number of tasks ``inflight`` and ``queued``, the
+        ``running`` tasks, and the keys of ``futures`` by state (see
+        :meth:`~flask_executor.futures.FutureCollection.by_state`).
+
+        Each running task is a dict of its ``task`` name and, for tasks run
+        on threads, the ``thread`` it runs on and the seconds ``elapsed``
+        since it started.
+        """
+        pool = InstanceProxy._self.fget(self)
+        inflight = list(self._inflight.items())
+        now = time.time()
+        if _on_threads(pool):
+            running = [
+                {'task': name, 'thread': ident, 'elapsed': now - started_at}
+                for ident, (name, started_at) in list(self._running.items())
+            ]
+        else:
+            running = [
+                {'task': task_name(fn), 'thread': None, 'elapsed': None}
+                for future, (fn, args, kwargs) in inflight if future.running()
+            ]
+        return {
+            'name': self.name,
+            'type': self._executor_type,
+            'max_workers': getattr(pool, '_max_workers', None),
+            'draining': self._draining,
+            'inflight': len(inflight),
+            'queued': sum(1 for future, _ in inflight if not future.running() and not future.done()),
+            'running': running,
+            'futures': self.futures.by_state(),
+        }
+
+    def profile(self, seconds=5, interval=0.01, limit=20):
+        """Samples the stacks of the worker threads that are running tasks
+        every ``interval`` seconds, for ``seconds``, and returns the
+        ``limit`` most common as a dict of the number of ``samples`` taken
+        and the ``stacks``, most frequent first. Each stack is a dict of the
+        ``task`` running, the ``count`` of samples it was seen in, and its
+        ``frames``, outermost first.
+
+        Only thread based executors can be profiled.
+        """
+        pool = self._self
+        if not _on_threads(pool):
+            raise TypeError("Only executors that run tasks on threads can be profiled")
+        counts = collections.Counter()
+        samples = 0
+        deadline = time.monotonic() + float(seconds)
+        while time.monotonic() < deadline:
+            frames = sys._current_frames()
+            for ident, (name, _) in list(self._running.items()):
+                frame = frames.get(ident)
+                if frame is not None:
+                    stack = tuple(
+                        '{} ({}:{})'.format(entry.name, entry.filename, entry.lineno)
+                        for entry in traceback.extract_stack(frame)
+                    )
+                    counts[name, stack] += 1
+            del frames
+            samples += 1
+            time.sleep(interval)
+        return {
+            'samples': samples,
+            'stacks': [
+                {'task': name, 'count': count, 'frames': list(stack)}
+                for (name, stack), count in counts.most_common(limit)
+            ],
+        }
+
+    def add_drain_callback(self, fn):
+        """Registers callable to be called with the :class:`DrainReport` when
+        the executor is drained, e.g. to persist dropped tasks so they can be
+        resubmitted once the application restarts.
+
+        :param fn: The callable to be added to the list of drain callbacks.
+        """
+        self._drain_callbacks.append(fn)
+
+    def drain(self, timeout=None):
+        """Stop accepting new tasks, wait up to ``timeout`` seconds for tasks
+        that are queued in the pool or running to finish, then cancel the
+        ones that haven't started and shut down the executor. Periodic tasks,
+        and tasks still waiting in the executor to be handed to the pool
+        (delayed, rate limited, waiting to be retried or for resources), are
+        cancelled straight away, so they never hold up the drain. Calling
+        :meth:`submit` or any related method while draining raises
+        :exc:`RuntimeError`.
+
+        The returned :class:`DrainReport` describes what was dropped, and is
+        also passed to every callable registered with
+        :meth:`add_drain_callback`. Tasks that were still running when the
+        timeout expired can't be interrupted; they are reported as
+        abandoned.
+
+        Example::
+
+            report = executor.drain(timeout=10)
+            for task in report.dropped:
+                save_for_later(task.fn.__name__, task.args, task.kwargs)
+
+        Tasks started with :meth:`map` on the underlying pool are cancelled
+        but not reported.
+
+        :param timeout: Seconds to wait for tasks to finish. Defaults to
+                        ``EXECUTOR_SHUTDOWN_TIMEOUT``; ``None`` waits for
+                        every task.
+
+        :rtype: flask_executor.executor.DrainReport
+        """
+        if timeout is None:
+            timeout = self._shutdown_timeout
+        with self._lock:
+            self._draining = True
+        for periodic_task in list(self._periodic_tasks):
+            periodic_task.cancel()
+        inflight = dict(self._inflight)
+        dropped, abandoned = [], []
+        for future, task in list(self._waiting.items()):
+            if future in inflight:
+                # A task waiting to be retried is already running, so can't
+                # simply be cancelled
+                if task.timer is not None:
+                    task.timer.cancel()
+                if not future.cancel():
+                    self._set_outcome(task, exc=concurrent.futures.CancelledError())
+                fn, args, kwargs = inflight.pop(future)
+                dropped.append(DroppedTask(inspect.unwrap(fn), args, kwargs, future))
+        done, not_done = concurrent.futures.wait(list(inflight), timeout)
+        for future in not_done:
+            fn, args, kwargs = inflight[future]
+            task = DroppedTask(inspect.unwrap(fn), args, kwargs, future)
+            if future.cancel():
+                dropped.append(task)
+            else:
+                abandoned.append(task)
+        self.shutdown(wait=False, cancel_futures=True)
+        report = DrainReport(len(done), dropped, abandoned)
+        if dropped or abandoned:
+            LOGGER.warning(
+                'Executor %r drained with %d task(s) dropped and %d still running',
+                self.name, len(dropped), len(abandoned)
+            )
+        for callback in self._drain_callbacks:
+            try:
+                callback(report)
+            except Exception:
+                LOGGER.exception('exception calling drain callback %r', callback)
+        return report
+
+    def drain_on_signals(self, signals=('SIGTERM',)):
+        """Install signal handlers that :meth:`drain` the executor, using
+        ``EXECUTOR_SHUTDOWN_TIMEOUT`` as the timeout, before handing the
+        signal on to the handler that was previously installed. This makes
+        deploys that stop the process with ``SIGTERM`` bounded and
+        predictable, rather than dropping queued work or waiting for all of
+        it. Handlers are installed by :meth:`init_app` when
+        ``EXECUTOR_DRAIN_SIGNALS`` is set, e.g. to ``['SIGTERM']``.
+
+        Signal handlers can only be installed from the main thread.
+
+        :param signals: Signal names or numbers.
+        """
+        import signal
+
+        if isinstance(signals, str):
+            signals = [signals]
+        for signum in signals:
+            if isinstance(signum, str):
+                signum = getattr(signal, signum.upper())
+            previous = signal.getsignal(signum)
+            try:
+                signal.signal(signum, functools.partial(self._drain_signal, previous))
+            except ValueError:
+                LOGGER.warning('Executor %r can only drain on signals installed '
+                               'from the main thread', self.name)
+                return
+
+    def _drain_signal(self, previous, signum, frame):
+        import signal
+
+        if not self._draining:
+            self.drain()
+        if callable(previous):
+            previous(signum, frame)
+        elif previous == signal.SIG_DFL:
+            signal.signal(signum, signal.SIG_DFL)
+            os.kill(os.getpid(), signum)
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        """Shut down the executor, see
+        :meth:`concurrent.futures.Executor.shutdown`. Tasks still waiting in
+        the executor's scheduler are cancelled, and with ``cancel_futures``
+        so are tasks queued in the pool.
+        """
+        with self._lock:
+            self._draining = True
+            # A pool that was never needed isn't created just to be shut down
+            self._pool_factory = None
+        if self._scheduler is not None:
+            for timer in self._scheduler.shutdown(wait=wait):
+                if timer.fn in (self._admit, self._dispatch):
+                    task = timer.args[0]
+                    if not task.future.cancel():
+                        self._set_outcome(task, exc=concurrent.futures.CancelledError())
+        if cancel_futures:
+            # Cancelled here rather than by the pool, which only supports
+            # cancel_futures from Python 3.9
+            for future in list(self._inflight):
+                future.cancel()
+        if self._partitioner is not None:
+            self._partitioner.shutdown(wait=wait, cancel_futures=cancel_futures)
+        if self._self is not None:
+            self._self.shutdown(wait=wait)
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=wait)
+        if self._callback_executor is not None:
+            self._callback_executor.shutdown(wait=wait)
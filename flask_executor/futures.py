@@ -1,9 +1,191 @@
+import copy
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import traceback
+import weakref
 from collections import OrderedDict
-from concurrent.futures import Future
+from concurrent.futures import CancelledError, Future
 
 from flask_executor.helpers import InstanceProxy
 
 
+LOGGER = logging.getLogger(__name__)
+
+# Guards DoneCallbacks state. Adding callbacks is rare and brief, so one lock
+# is shared rather than allocating a lock for every Future.
+_callbacks_lock = threading.Lock()
+
+# How a FutureCollection keeps Futures once they complete
+RETENTION_MODES = ('full', 'compact')
+
+
+def _invoke_callback(fn, future):
+    try:
+        fn(future)
+    except Exception:
+        LOGGER.exception('exception calling callback for %r', future)
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class SpilledResult:
+    """A handle for a task result that was too large to keep in memory, and
+    was pickled to a temporary file instead. :meth:`FutureProxy.result`
+    loads the result from the file each time it is called, and the file is
+    removed once the handle is garbage collected, e.g. after its Future is
+    popped from a :class:`FutureCollection` and dropped.
+
+    :param path: The file the pickled result was written to.
+    :param size: The size of the pickled result in bytes.
+    """
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self._finalizer = weakref.finalize(self, _remove_file, path)
+
+    def load(self):
+        """Unpickle and return the result."""
+        with open(self.path, 'rb') as f:
+            return pickle.load(f)
+
+    def __getstate__(self):
+        # A handle sent back from a worker process hands the file over to
+        # the copy that is unpickled by the parent
+        self._finalizer.detach()
+        return {'path': self.path, 'size': self.size}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['size'])
+
+    def __repr__(self):
+        return '<SpilledResult {!r} ({} bytes)>'.format(self.path, self.size)
+
+
+def _spilled(future):
+    return not future.cancelled() and future.exception() is None \
+        and isinstance(future.result(), SpilledResult)
+
+
+def spill_result(max_bytes, directory, fn, *args, **kwargs):
+    """Call ``fn`` and return its result, or a :class:`SpilledResult` if the
+    pickled result is larger than ``max_bytes``. Results that can't be
+    pickled are always returned as they are.
+
+    :param max_bytes: The largest result, once pickled, kept in memory.
+    :param directory: The directory for spilled results, defaulting to the
+                      system's temporary directory.
+    :param fn: The callable to be executed.
+    """
+    result = fn(*args, **kwargs)
+    try:
+        data = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return result
+    if len(data) <= max_bytes:
+        return result
+    fd, path = tempfile.mkstemp(prefix='flask-executor-', suffix='.pickle', dir=directory)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    return SpilledResult(path, len(data))
+
+
+def _frameless_copy(exc):
+    # A copy of exc without its traceback or chained exceptions, whose frames
+    # would otherwise keep every local variable of the failed task alive.
+    # The exception itself is left alone, as the submitter may hold it.
+    try:
+        exc = copy.copy(exc)
+    except Exception:
+        # Exceptions that can't be rebuilt from their args keep their message
+        exc = Exception('{}: {}'.format(type(exc).__name__, exc))
+    exc.__traceback__ = None
+    exc.__cause__ = exc.__context__ = None
+    return exc
+
+
+class CompletedFuture:
+    """The compact record a :class:`FutureCollection` keeps in place of a
+    Future that has completed, when it is created with
+    ``retention='compact'``. It holds the Future's state and its result or
+    exception, stripped of its traceback frames, and answers the same
+    queries as the Future. It no longer references the Future itself, the
+    Flask contexts captured for it or its callbacks.
+
+    :param future: The completed :class:`~concurrent.futures.Future`.
+    """
+
+    __slots__ = ('_state', '_result', '_exception', 'traceback', '_future')
+
+    def __init__(self, future):
+        self._state = future._state
+        self._result = None
+        self._exception = None
+        #: The exception's traceback, formatted as a string, or ``None``.
+        self.traceback = None
+        if not future.cancelled():
+            exc = future.exception()
+            if exc is None:
+                self._result = future.result()
+            else:
+                self.traceback = ''.join(
+                    traceback.format_exception(type(exc), exc, exc.__traceback__)
+                )
+                self._exception = _frameless_copy(exc)
+        # Only used to compare equal to the Future while it is still alive
+        self._future = weakref.ref(future)
+
+    def cancel(self):
+        return self.cancelled()
+
+    def cancelled(self):
+        return self._state in ('CANCELLED', 'CANCELLED_AND_NOTIFIED')
+
+    def running(self):
+        return False
+
+    def done(self):
+        return True
+
+    def result(self, timeout=None):
+        if self.cancelled():
+            raise CancelledError()
+        if self._exception is not None:
+            raise self._exception
+        if isinstance(self._result, SpilledResult):
+            return self._result.load()
+        return self._result
+
+    def exception(self, timeout=None):
+        if self.cancelled():
+            raise CancelledError()
+        return self._exception
+
+    def add_done_callback(self, fn):
+        _invoke_callback(fn, self)
+
+    def __eq__(self, obj):
+        if obj is self:
+            return True
+        future = self._future()
+        if future is None:
+            return NotImplemented
+        return getattr(obj, '_self', obj) is future
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '<CompletedFuture at {:#x} state={}>'.format(id(self), self._state.lower())
+
+
 class FutureCollection:
     """A FutureCollection is an object to store and interact with
     :class:`concurrent.futures.Future` objects. It provides access to all
@@ -24,14 +206,26 @@ class FutureCollection:
     attribute form used to determine whether a Future is ready to be used or
     discarded.
 
+    Stored Futures keep their results, exceptions and tracebacks, and
+    through them the frames and locals of failed tasks, until they are
+    popped. With ``retention='compact'`` each Future is replaced by a
+    :class:`CompletedFuture` record once it completes, which keeps only its
+    state, its result or exception and a formatted traceback.
+
     :param max_length: Maximum number of Futures to store. Oldest Futures are
     discarded first.
+    :param retention: ``'full'`` to keep the Futures themselves, or
+    ``'compact'`` to replace completed Futures with records.
 
     """
 
-    def __init__(self, max_length=50):
+    def __init__(self, max_length=50, retention='full'):
+        if retention not in RETENTION_MODES:
+            raise ValueError("retention must be one of {}".format(', '.join(RETENTION_MODES)))
         self.max_length = max_length
+        self.retention = retention
         self._futures = OrderedDict()
+        self._lock = threading.Lock()
 
     def __contains__(self, future):
         return future in self._futures.values()
@@ -63,21 +257,129 @@ class FutureCollection:
         :param future_key: Key for the Future to be added.
         :param future: Future to be added.
         """
-        if future_key in self._futures:
-            raise ValueError("future_key {} already exists".format(future_key))
-        self._futures[future_key] = future
-        self._check_limits()
+        with self._lock:
+            if future_key in self._futures:
+                raise ValueError("future_key {} already exists".format(future_key))
+            self._futures[future_key] = future
+            self._check_limits()
+        if self.retention == 'compact':
+            # Attached to the Future itself, as a callback added through a
+            # FutureProxy would capture the Flask contexts
+            getattr(future, '_self', future).add_done_callback(
+                lambda done: self._compact(future_key, future, done)
+            )
+
+    def _compact(self, future_key, future, done):
+        record = CompletedFuture(done)
+        with self._lock:
+            # The key may have been popped, or reused, in the meantime
+            if self._futures.get(future_key) is future:
+                self._futures[future_key] = record
 
     def pop(self, future_key):
         """Return a Future and remove it from the collection. Futures that are
         ready to be used should always be popped so they do not continue to
         consume memory.
 
-        Returns ``None`` if the key doesn't exist.
+        Returns ``None`` if the key doesn't exist, and a
+        :class:`CompletedFuture` if the Future completed while stored with
+        ``retention='compact'``.
 
         :param future_key: Key for the Future to be returned.
         """
-        return self._futures.pop(future_key, None)
+        with self._lock:
+            return self._futures.pop(future_key, None)
+
+    def by_state(self):
+        """Return the keys of the stored Futures grouped by state: a dict
+        mapping ``'pending'``, ``'running'``, ``'cancelled'``, ``'failed'``
+        and ``'finished'`` to lists of keys, oldest first."""
+        states = {state: [] for state in ('pending', 'running', 'cancelled', 'failed', 'finished')}
+        for future_key, future in list(self._futures.items()):
+            if future.cancelled():
+                state = 'cancelled'
+            elif future.done():
+                state = 'failed' if future.exception() is not None else 'finished'
+            else:
+                state = 'running' if future.running() else 'pending'
+            states[state].append(future_key)
+        return states
+
+
+class DoneCallbacks:
+    """A single done callback, attached once to each Future an executor
+    creates, that runs the executor's default done callbacks followed by any
+    callbacks added through :meth:`FutureProxy.add_done_callback`.
+
+    Callbacks of a Future whose result was spilled are passed a
+    :class:`FutureProxy` for it instead, so ``result()`` loads the result
+    as it does for the submitter.
+    Callbacks added through the proxy all run inside one copy of the Flask
+    application and request contexts, captured when the first of them is
+    added, instead of each callback capturing and pushing its own copy. When
+    ``callback_executor`` is set, callbacks run there instead of on the
+    worker that completed the Future.
+
+    :param executor: The :class:`flask_executor.Executor` that created the
+                     Future.
+    :param callbacks: Callbacks to run without Flask contexts, in order.
+    :param callback_executor: An optional
+                              :class:`concurrent.futures.Executor` to run
+                              callbacks on.
+    """
+
+    __slots__ = ('executor', 'callbacks', 'context_callbacks',
+                 'callback_executor', '_run_in_context', '_fired')
+
+    def __init__(self, executor, callbacks=(), callback_executor=None):
+        self.executor = executor
+        self.callbacks = tuple(callbacks)
+        self.context_callbacks = []
+        self.callback_executor = callback_executor
+        self._run_in_context = None
+        self._fired = False
+
+    def add(self, fn):
+        """Add a callback to be run inside the captured Flask contexts.
+        Returns ``False`` if the Future has already completed, in which case
+        the caller must run the callback itself."""
+        run_in_context = self._run_in_context
+        if run_in_context is None:
+            run_in_context = self.executor._prepare_fn(
+                self._run_context_callbacks, force_copy=True
+            )
+        with _callbacks_lock:
+            if self._fired:
+                return False
+            if self._run_in_context is None:
+                self._run_in_context = run_in_context
+            self.context_callbacks.append(fn)
+        return True
+
+    def __call__(self, future):
+        with _callbacks_lock:
+            self._fired = True
+        if self.callback_executor is not None:
+            try:
+                self.callback_executor.submit(self._run, future)
+                return
+            except RuntimeError:
+                # The callback executor has been shut down
+                pass
+        self._run(future)
+
+    def _run(self, future):
+        if _spilled(future):
+            # Callbacks get a proxy, whose result() loads the result
+            future = FutureProxy(future, self.executor, self)
+        for fn in self.callbacks:
+            _invoke_callback(fn, future)
+        if self.context_callbacks:
+            self._run_in_context(future)
+
+    def _run_context_callbacks(self, future):
+        for fn in self.context_callbacks:
+            _invoke_callback(fn, future)
 
 
 class FutureProxy(InstanceProxy, Future):
@@ -90,15 +392,43 @@ class FutureProxy(InstanceProxy, Future):
                    the proxy will provide access to.
     :param executor: An instance of :class:`flask_executor.Executor` which
                      will be used to provide access to Flask context features.
+    :param callbacks: The :class:`DoneCallbacks` attached to ``future``, if
+                      any. Callbacks added through the proxy are handed to
+                      it so they share a single copy of the Flask contexts;
+                      one is attached when the first callback is added
+                      otherwise.
     """
 
-    def __init__(self, future, executor):
+    def __init__(self, future, executor, callbacks=None):
         self._self = future
         self._executor = executor
+        self._callbacks = callbacks
 
     def add_done_callback(self, fn):
+        if self._callbacks is None:
+            callbacks = DoneCallbacks(
+                self._executor, callback_executor=self._executor._callback_executor
+            )
+            callbacks.add(fn)
+            self._callbacks = callbacks
+            # Runs the callback straight away if the future is already done
+            return self._self.add_done_callback(callbacks)
+        if self._callbacks.add(fn):
+            return
+        # The future is done, so the callback runs straight away
         fn = self._executor._prepare_fn(fn, force_copy=True)
-        return self._self.add_done_callback(fn)
+        _invoke_callback(fn, self if _spilled(self._self) else self._self)
+
+    def result(self, timeout=None):
+        timeout = self._executor._help_until(self._self, timeout)
+        result = self._self.result(timeout)
+        if isinstance(result, SpilledResult):
+            return result.load()
+        return result
+
+    def exception(self, timeout=None):
+        timeout = self._executor._help_until(self._self, timeout)
+        return self._self.exception(timeout)
 
     def __eq__(self, obj):
         return self._self == obj
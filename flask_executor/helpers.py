@@ -1,3 +1,9 @@
+import concurrent.futures
+import functools
+import os
+import sys
+
+
 PROXIED_OBJECT = '__proxied_object'
 
 
@@ -5,6 +11,27 @@ def str2bool(v):
     return str(v).lower() in ("yes", "true", "t", "1")
 
 
+def gil_enabled():
+    """Whether the running interpreter has a GIL. Free-threaded builds of
+    CPython 3.13 and later run without one unless it is re-enabled, e.g. by
+    an extension module that doesn't support free threading."""
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return True if is_gil_enabled is None else is_gil_enabled()
+
+
+@functools.lru_cache(maxsize=None)
+def interpreter_pool():
+    """The :class:`concurrent.futures.InterpreterPoolExecutor` class, on
+    Python 3.14 and later, or ``None``. It is looked up on first use, as
+    importing it loads the interpreters module."""
+    return getattr(concurrent.futures, 'InterpreterPoolExecutor', None)
+
+
+def cpu_count():
+    """The number of CPUs this process may run on."""
+    return getattr(os, 'process_cpu_count', os.cpu_count)() or 1
+
+
 class InstanceProxy(object):
 
     def __init__(self, proxied_obj):
@@ -28,7 +55,7 @@ class InstanceProxy(object):
         inst_dict = object.__getattribute__(self, '__dict__')
         if attr in cls_dict or attr in inst_dict or attr in super_cls_dict:
             return object.__getattribute__(self, attr)
-        target_obj = object.__getattribute__(self, PROXIED_OBJECT)
+        target_obj = object.__getattribute__(self, '_self')
         return object.__getattribute__(target_obj, attr)
 
     def __repr__(self):
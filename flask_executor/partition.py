@@ -0,0 +1,128 @@
+import collections
+import concurrent.futures
+import threading
+
+
+class Partitioner:
+    """Routes tasks by key onto lanes, each with a thread of its own that
+    runs the lane's tasks one at a time. Tasks with the same key run one
+    after another, in the order they were submitted, and on the same
+    thread, which keeps per-key caches and thread-local state warm.
+
+    A key's lane is chosen by hashing it. When a lane gets hot, and its
+    queue is more than ``slack`` tasks longer than the shortest, keys that
+    have nothing queued are routed to the shortest lane instead. A key only
+    moves once all of its earlier tasks have finished, so its tasks still
+    run in order; it runs on the new lane's thread from then on.
+
+    Lane threads are started with the first task routed to them and run
+    until :meth:`shutdown` is called.
+
+    :param lanes: The number of lanes, and so of threads.
+    :param slack: How much longer than the shortest a lane may get before
+                  new keys are routed away from it.
+    :param name: The prefix of the lane threads' names.
+    """
+
+    def __init__(self, lanes, slack=4, name='flask-executor-partition'):
+        if int(lanes) < 1:
+            raise ValueError("lanes must be at least 1")
+        self.slack = int(slack)
+        self.name = name
+        self._lock = threading.Lock()
+        self._lanes = [collections.deque() for _ in range(int(lanes))]
+        # Each lane's thread waits on a condition of its own, sharing the lock
+        self._wakeups = [threading.Condition(self._lock) for _ in self._lanes]
+        self._threads = [None] * len(self._lanes)
+        self._keys = {}
+        self._shutdown = False
+
+    def lane(self, key):
+        """The lane ``key``'s tasks are queued on, or ``None`` if it has no
+        tasks queued or running."""
+        with self._lock:
+            routed = self._keys.get(key)
+            return None if routed is None else routed[0]
+
+    def depths(self):
+        """The number of tasks queued on each lane."""
+        with self._lock:
+            return [len(lane) for lane in self._lanes]
+
+    def _route(self, key):
+        routed = self._keys.get(key)
+        if routed is None:
+            lane = hash(key) % len(self._lanes)
+            coolest = min(range(len(self._lanes)), key=lambda i: len(self._lanes[i]))
+            if len(self._lanes[lane]) > len(self._lanes[coolest]) + self.slack:
+                lane = coolest
+            routed = self._keys[key] = [lane, 0]
+        routed[1] += 1
+        return routed[0]
+
+    def _finished(self, key):
+        routed = self._keys[key]
+        routed[1] -= 1
+        if not routed[1]:
+            del self._keys[key]
+
+    def submit(self, key, fn, *args, **kwargs):
+        """Queue ``fn(*args, **kwargs)`` behind the other tasks for ``key``
+        and return a :class:`concurrent.futures.Future` for it."""
+        future = concurrent.futures.Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError('cannot schedule new tasks after shutdown')
+            lane = self._route(key)
+            self._lanes[lane].append((key, future, fn, args, kwargs))
+            if self._threads[lane] is None:
+                thread = threading.Thread(
+                    target=self._run, args=(lane,), name='{}-{}'.format(self.name, lane)
+                )
+                thread.daemon = True
+                self._threads[lane] = thread
+                thread.start()
+            else:
+                self._wakeups[lane].notify()
+        return future
+
+    def _run(self, lane):
+        tasks = self._lanes[lane]
+        while True:
+            with self._lock:
+                while not tasks and not self._shutdown:
+                    self._wakeups[lane].wait()
+                if not tasks:
+                    return
+                key, future, fn, args, kwargs = tasks.popleft()
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        result = fn(*args, **kwargs)
+                    except BaseException as exc:
+                        future.set_exception(exc)
+                    else:
+                        future.set_result(result)
+            finally:
+                with self._lock:
+                    self._finished(key)
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        """Stop accepting tasks and stop the lane threads once their queues
+        are empty. With ``cancel_futures`` queued tasks are cancelled
+        rather than run."""
+        with self._lock:
+            self._shutdown = True
+            if cancel_futures:
+                for tasks in self._lanes:
+                    while tasks:
+                        key, future = tasks.popleft()[:2]
+                        future.cancel()
+                        self._finished(key)
+            for wakeup in self._wakeups:
+                wakeup.notify()
+            threads = [thread for thread in self._threads if thread is not None]
+        if wait:
+            for thread in threads:
+                if thread is not threading.current_thread():
+                    thread.join()
@@ -0,0 +1,68 @@
+import re
+import threading
+import time
+
+
+RATE_PERIODS = {
+    's': 1, 'sec': 1, 'second': 1, 'seconds': 1,
+    'm': 60, 'min': 60, 'minute': 60, 'minutes': 60,
+    'h': 3600, 'hour': 3600, 'hours': 3600,
+    'd': 86400, 'day': 86400, 'days': 86400,
+}
+
+RATE_PATTERN = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*/\s*(\d*)\s*([a-z]+)\s*$')
+
+
+def parse_rate(rate):
+    """Convert a rate into a number of tasks per second. Rates may be given
+    as a number (tasks per second) or as a string such as ``'100/s'``,
+    ``'30/m'``, ``'1000/h'`` or ``'5/10s'``.
+    """
+    if isinstance(rate, (int, float)):
+        value = float(rate)
+    else:
+        match = RATE_PATTERN.match(str(rate).lower())
+        if match is None or match.group(3) not in RATE_PERIODS:
+            raise ValueError("{} is not a valid rate.".format(rate))
+        count, multiple, period = match.groups()
+        value = float(count) / (RATE_PERIODS[period] * int(multiple or 1))
+    if value <= 0:
+        raise ValueError("{} is not a valid rate.".format(rate))
+    return value
+
+
+class TokenBucket:
+    """A thread-safe token bucket that hands out reservations rather than
+    blocking. Each call to :meth:`reserve` takes one token and returns the
+    :func:`time.monotonic` time at which that token becomes available, so
+    callers can defer work until then without holding a thread.
+
+    :param rate: The sustained rate, see :func:`parse_rate`.
+    :param burst: The number of tasks that may start back to back before the
+                  rate applies. Defaults to 1.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = parse_rate(rate)
+        self.burst = int(burst) if burst is not None else 1
+        if self.burst < 1:
+            raise ValueError("burst must be at least 1")
+        self._interval = 1.0 / self.rate
+        self._tolerance = (self.burst - 1) * self._interval
+        self._tat = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, now=None):
+        """Take a token and return the time at which it may be used, at the
+        earliest ``now``, which defaults to the current time."""
+        # A time in the past would let the token be taken for free
+        now = time.monotonic() if now is None else max(now, time.monotonic())
+        with self._lock:
+            tat = max(self._tat, now)
+            when = tat - self._tolerance
+            # Summed intervals drift by rounding errors, which mustn't delay
+            # tasks that are within the burst
+            if when < now + 1e-9:
+                when = now
+            self._tat = tat + self._interval
+        return when
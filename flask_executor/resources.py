@@ -0,0 +1,96 @@
+import collections
+import threading
+
+
+class ResourceBudget:
+    """Counts out limited resources, such as memory or database
+    connections, among the tasks that declare they need them. Tasks whose
+    needs don't fit wait in the budget, rather than in a worker, and start
+    as soon as running tasks release enough.
+
+    Waiting tasks start in order, except that a later task may overtake
+    those ahead of it if it fits and needs none of the resources they are
+    waiting for. Tasks that need nothing scarce keep the workers busy,
+    while the heavy task at the head of the queue is never starved.
+
+    Example::
+
+        budget = ResourceBudget({'memory': 8192, 'db': 10})
+
+    :param capacities: A dict mapping each resource's name to the amount
+                       available.
+    """
+
+    def __init__(self, capacities):
+        self.capacities = {name: float(amount) for name, amount in capacities.items()}
+        self.available = dict(self.capacities)
+        self._waiting = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, needs):
+        """Raise :exc:`ValueError` if ``needs`` names an unknown resource, or
+        more of one than the budget holds, so could never be met."""
+        for name, amount in needs.items():
+            if name not in self.capacities:
+                raise ValueError("No budget for resource {!r}".format(name))
+            if amount > self.capacities[name]:
+                raise ValueError("{} {!r} needed, but the budget only holds {}".format(
+                    amount, name, self.capacities[name]
+                ))
+
+    def _fits(self, needs, blocked):
+        return all(
+            self.available[name] >= amount and name not in blocked
+            for name, amount in needs.items()
+        )
+
+    def _take(self, needs):
+        for name, amount in needs.items():
+            self.available[name] -= amount
+
+    def _blocked(self):
+        return {name for needs, _ in self._waiting.values() for name in needs}
+
+    def acquire(self, key, needs, callback):
+        """Take ``needs`` and return ``True`` if they are available.
+        Otherwise queue the request under ``key`` and return ``False``;
+        ``callback`` is called once the resources have been taken for it."""
+        with self._lock:
+            if self._fits(needs, self._blocked()):
+                self._take(needs)
+                return True
+            self._waiting[key] = (needs, callback)
+            return False
+
+    def release(self, needs):
+        """Return ``needs`` to the budget, and start the waiting requests
+        that now fit."""
+        with self._lock:
+            for name, amount in needs.items():
+                self.available[name] += amount
+        self._wake()
+
+    def discard(self, key):
+        """Drop a waiting request, e.g. because its task was cancelled."""
+        with self._lock:
+            removed = self._waiting.pop(key, None) is not None
+        if removed:
+            self._wake()
+
+    def _wake(self):
+        ready = []
+        with self._lock:
+            blocked = set()
+            for key, (needs, callback) in list(self._waiting.items()):
+                if self._fits(needs, blocked):
+                    self._take(needs)
+                    del self._waiting[key]
+                    ready.append(callback)
+                else:
+                    blocked.update(needs)
+        for callback in ready:
+            callback()
+
+    def __len__(self):
+        """The number of waiting requests."""
+        return len(self._waiting)
@@ -0,0 +1,67 @@
+import random
+
+
+class RetryPolicy:
+    """Describes how failed tasks are retried. Retries are re-submitted by
+    the executor's scheduler once their backoff has elapsed, so a task
+    waiting to be retried never holds a worker.
+
+    The delay before retry ``n`` is ``backoff * multiplier ** (n - 1)``,
+    capped at ``max_backoff``. With ``jitter`` enabled a random delay between
+    zero and that value is used instead, which spreads out retries from
+    tasks that failed at the same time.
+
+    Example::
+
+        policy = RetryPolicy(max_attempts=5, backoff=0.5, retry_on=(IOError,))
+
+        @executor.job(retry=policy)
+        def fetch(url):
+            return urlopen(url).read()
+
+    :param max_attempts: Total number of attempts, including the first.
+    :param backoff: Base delay in seconds before the first retry.
+    :param multiplier: Factor the delay grows by with each retry.
+    :param max_backoff: Upper bound for the delay in seconds.
+    :param jitter: Whether to randomise delays.
+    :param retry_on: Exception types that should be retried.
+    :param giveup_on: Exception types that should never be retried, even if
+                      they match ``retry_on``.
+    """
+
+    def __init__(self, max_attempts=3, backoff=1.0, multiplier=2.0,
+                 max_backoff=60.0, jitter=True, retry_on=(Exception,),
+                 giveup_on=()):
+        if int(max_attempts) < 1:
+            raise ValueError("max_attempts must be at least 1")
+        self.max_attempts = int(max_attempts)
+        self.backoff = float(backoff)
+        self.multiplier = float(multiplier)
+        self.max_backoff = float(max_backoff)
+        self.jitter = jitter
+        self.retry_on = tuple(retry_on)
+        self.giveup_on = tuple(giveup_on)
+
+    @classmethod
+    def coerce(cls, retry):
+        """Build a policy from a job's ``retry`` option, which may be
+        ``None``, a number of attempts or a :class:`RetryPolicy`."""
+        if retry is None or isinstance(retry, cls):
+            return retry
+        return cls(max_attempts=retry)
+
+    def should_retry(self, attempt, exc):
+        """Whether a task that raised ``exc`` on attempt number ``attempt``
+        should be tried again."""
+        if attempt >= self.max_attempts:
+            return False
+        if isinstance(exc, self.giveup_on):
+            return False
+        return isinstance(exc, self.retry_on)
+
+    def delay(self, attempt):
+        """Seconds to wait before the attempt following ``attempt``."""
+        delay = min(self.max_backoff, self.backoff * self.multiplier ** (attempt - 1))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
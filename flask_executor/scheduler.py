@@ -0,0 +1,197 @@
+import datetime
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def to_seconds(delay):
+    """Convert a delay given in seconds or as a :class:`datetime.timedelta`
+    into seconds."""
+    if isinstance(delay, datetime.timedelta):
+        return delay.total_seconds()
+    return float(delay)
+
+
+def to_monotonic(when):
+    """Convert a wall clock time, given as a :class:`datetime.datetime` or a
+    Unix timestamp, into a :func:`time.monotonic` deadline. Naive datetimes
+    are treated as local time."""
+    if isinstance(when, datetime.datetime):
+        when = when.timestamp()
+    return time.monotonic() + (float(when) - time.time())
+
+
+class Timer:
+    """A handle for a callable scheduled with a :class:`Scheduler`. Timers
+    can be cancelled up until the moment they fire.
+
+    :param when: The :func:`time.monotonic` deadline at which to fire.
+    :param fn: The callable to be invoked.
+    :param args: Positional arguments for the callable.
+    """
+
+    __slots__ = ('when', 'fn', 'args', 'cancelled')
+
+    def __init__(self, when, fn, args):
+        self.when = when
+        self.fn = fn
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        """Prevent the timer from firing. Returns ``False`` if the timer was
+        already cancelled."""
+        if self.cancelled:
+            return False
+        self.cancelled = True
+        return True
+
+
+class Scheduler:
+    """A single background thread that fires timers from a heap ordered by
+    deadline. Any number of pending timers cost one thread, so work that must
+    wait (rate limited, delayed or retried tasks) is held here rather than
+    occupying an executor worker.
+
+    Timer callables run on the scheduler thread and should only hand work off
+    to an executor; they must never block.
+    """
+
+    def __init__(self, name='flask-executor-scheduler'):
+        self.name = name
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._shutdown = False
+
+    def __len__(self):
+        with self._condition:
+            return sum(1 for _, _, timer in self._heap if not timer.cancelled)
+
+    def call_at(self, when, fn, *args):
+        """Schedule ``fn(*args)`` to run at the :func:`time.monotonic`
+        deadline ``when``.
+
+        :rtype: flask_executor.scheduler.Timer
+        """
+        timer = Timer(when, fn, args)
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError('cannot schedule new timers after shutdown')
+            heapq.heappush(self._heap, (when, next(self._counter), timer))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name)
+                self._thread.daemon = True
+                self._thread.start()
+            elif self._heap[0][2] is timer:
+                self._condition.notify()
+        return timer
+
+    def call_later(self, delay, fn, *args):
+        """Schedule ``fn(*args)`` to run after ``delay`` seconds.
+
+        :rtype: flask_executor.scheduler.Timer
+        """
+        return self.call_at(time.monotonic() + delay, fn, *args)
+
+    def shutdown(self, wait=True):
+        """Stop the scheduler thread. Pending timers are discarded and
+        returned so callers can decide what to do with them.
+        """
+        with self._condition:
+            self._shutdown = True
+            pending = [timer for _, _, timer in self._heap if not timer.cancelled]
+            self._heap = []
+            self._condition.notify()
+            thread = self._thread
+        if wait and thread is not None and thread is not threading.current_thread():
+            thread.join()
+        return pending
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._shutdown:
+                    if not self._heap:
+                        self._condition.wait()
+                        continue
+                    timeout = self._heap[0][0] - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    self._condition.wait(timeout)
+                if self._shutdown:
+                    return
+                _, _, timer = heapq.heappop(self._heap)
+            if timer.cancelled:
+                continue
+            try:
+                timer.fn(*timer.args)
+            except Exception:
+                LOGGER.exception('exception calling timer %r', timer.fn)
+
+
+class PeriodicTask:
+    """A handle for a task that is submitted at a fixed interval by a
+    :class:`Scheduler`. A run is skipped if the previous run is still in
+    progress, and runs missed while the process was busy are not made up.
+
+    :param scheduler: The scheduler that fires each run.
+    :param interval: Seconds between runs.
+    :param submit: A callable that submits a single run and returns its
+                   :class:`~concurrent.futures.Future`.
+    """
+
+    def __init__(self, scheduler, interval, submit):
+        if interval <= 0:
+            raise ValueError("interval must be greater than zero")
+        self.scheduler = scheduler
+        self.interval = interval
+        self.future = None
+        self.next_run = None
+        self.cancelled = False
+        self._submit = submit
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def start(self, first_run=None):
+        """Schedule the first run at the monotonic time ``first_run``, which
+        defaults to one interval from now."""
+        if first_run is None:
+            first_run = time.monotonic() + self.interval
+        with self._lock:
+            self.next_run = first_run
+            self._timer = self.scheduler.call_at(first_run, self._run)
+        return self
+
+    def cancel(self):
+        """Stop scheduling further runs. A run already in progress is not
+        interrupted."""
+        with self._lock:
+            if self.cancelled:
+                return False
+            self.cancelled = True
+            if self._timer is not None:
+                self._timer.cancel()
+        return True
+
+    def _run(self):
+        with self._lock:
+            if self.cancelled:
+                return
+            now = time.monotonic()
+            while self.next_run <= now:
+                self.next_run += self.interval
+            self._timer = self.scheduler.call_at(self.next_run, self._run)
+            if self.future is not None and not self.future.done():
+                return
+        try:
+            self.future = self._submit()
+        except RuntimeError:
+            # The executor has been shut down, which ends the schedule
+            self.cancel()
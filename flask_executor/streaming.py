@@ -0,0 +1,164 @@
+import concurrent.futures
+import functools
+import queue
+import weakref
+
+
+_END = object()
+
+
+class _Channel:
+    # The state shared by a stream's producer and its consumer. The worker
+    # only references the channel, never the ResultStream, so a stream that
+    # is dropped can be collected and close the channel.
+
+    __slots__ = ('queue', 'closed', 'error')
+
+    def __init__(self, buffer_size):
+        self.queue = queue.Queue(maxsize=buffer_size)
+        self.closed = False
+        self.error = None
+
+    def close(self):
+        self.closed = True
+
+    def put(self, item):
+        # Returns False once the consumer has closed the stream
+        while not self.closed:
+            try:
+                self.queue.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            return True
+        return False
+
+    def put_end(self):
+        try:
+            self.queue.put_nowait(_END)
+        except queue.Full:
+            # The producer's own end marker is queued behind the chunks
+            pass
+
+    def produce(self, fn, *args, **kwargs):
+        if self.closed:
+            # Dropped, or closed, before the task started
+            return
+        generator = fn(*args, **kwargs)
+        try:
+            for chunk in generator:
+                if not self.put(chunk):
+                    break
+        except BaseException as exc:
+            self.error = exc
+            raise
+        finally:
+            generator.close()
+            self.put(_END)
+
+
+class ResultStream:
+    """The handle returned when a generator function is submitted to a
+    thread based executor. The generator runs on a worker and its chunks
+    are passed to the consumer through a buffer of at most ``buffer_size``
+    chunks, as they are produced. Once the buffer is full the worker waits
+    for the consumer to catch up, so a slow client holds back the producer
+    rather than letting chunks pile up in memory.
+
+    Iterate over the stream to consume its chunks. If the generator raises,
+    iteration raises the same exception once the chunks produced before it
+    have been consumed::
+
+        @executor.job
+        def export(query):
+            for page in paginate(query):
+                yield render_csv(page)
+
+        @app.route('/export')
+        def export_view():
+            return export.submit(request.args['q']).response(mimetype='text/csv')
+
+    A stream that is dropped without being consumed or closed is closed
+    once it is garbage collected, so its worker is never left waiting for a
+    consumer that has gone.
+
+    :param buffer_size: The number of chunks that may wait to be consumed.
+    """
+
+    def __init__(self, buffer_size=16):
+        if int(buffer_size) < 1:
+            raise ValueError("buffer_size must be at least 1")
+        self.future = None
+        self._channel = _Channel(int(buffer_size))
+        self._exhausted = False
+        weakref.finalize(self, self._channel.close)
+
+    def _attach(self, future):
+        # Wakes the consumer of a stream whose task is cancelled, or fails,
+        # before the generator starts
+        self.future = future
+        channel = self._channel
+        future.add_done_callback(lambda future: channel.put_end())
+
+    def produce(self, fn, *args, **kwargs):
+        """Run the generator function ``fn`` and pass its chunks to the
+        consumer. This is what runs on the worker."""
+        self._channel.produce(fn, *args, **kwargs)
+
+    def chunks(self, timeout=None):
+        """Return an iterator over the chunks. ``timeout`` is the longest to
+        wait, in seconds, for each chunk, after which
+        :exc:`concurrent.futures.TimeoutError` is raised and the stream is
+        closed. Closing the iterator before it is exhausted also closes the
+        stream."""
+        try:
+            while not self._exhausted:
+                try:
+                    chunk = self._channel.queue.get(timeout=timeout)
+                except queue.Empty:
+                    raise concurrent.futures.TimeoutError()
+                if chunk is _END:
+                    self._exhausted = True
+                    if self._channel.error is not None:
+                        raise self._channel.error
+                    if self.future.cancelled():
+                        raise concurrent.futures.CancelledError()
+                    if self.future.done() and self.future.exception() is not None:
+                        raise self.future.exception()
+                    return
+                yield chunk
+        finally:
+            if not self._exhausted:
+                self.close()
+
+    def __iter__(self):
+        return self.chunks()
+
+    def cancel(self):
+        """Stop consuming the stream. A generator that hasn't started is
+        cancelled, and a running one is closed once it yields its next
+        chunk. Returns ``True`` if the generator hadn't started."""
+        self._channel.close()
+        self._exhausted = True
+        return self.future.cancel()
+
+    def close(self):
+        """Stop consuming the stream, as :meth:`cancel` does."""
+        self.cancel()
+
+    def response(self, **kwargs):
+        """Return a streaming :class:`flask.Response` of the chunks. Keyword
+        arguments are passed on to the response, e.g. ``mimetype``. The
+        stream is closed if the client disconnects."""
+        # Imported here, as only views need it
+        from flask import Response
+
+        return Response(self.chunks(), **kwargs)
+
+    def __repr__(self):
+        return '<ResultStream {!r}>'.format(self.future)
+
+
+def streamed(stream, fn):
+    """Wrap the generator function ``fn`` to run through ``stream``. The
+    wrapper doesn't keep ``stream`` itself alive."""
+    return functools.update_wrapper(functools.partial(stream._channel.produce, fn), fn)
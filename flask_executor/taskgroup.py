@@ -0,0 +1,134 @@
+import concurrent.futures
+import contextvars
+import threading
+
+from flask import after_this_request, g, has_request_context
+
+
+_current_group = contextvars.ContextVar('flask_executor_task_group', default=None)
+
+
+def current_task_group(executor):
+    """Return the :class:`TaskGroup` for ``executor`` that is active in the
+    current context, if any."""
+    group = _current_group.get()
+    # Workers run with a copy of the submitting thread's context variables,
+    # but tasks they submit don't join its group
+    if group is not None and group.executor is executor \
+            and group._thread is threading.current_thread():
+        return group
+    return None
+
+
+class TaskGroup:
+    """Tracks the tasks submitted to an executor while the group is active,
+    so that a view which fans out can wait for all of them, or cancel them
+    together. Groups are created with
+    :meth:`~flask_executor.Executor.task_group` and used as a context
+    manager::
+
+        with executor.task_group(timeout=5) as group:
+            for url in urls:
+                executor.submit(fetch, url)
+        results = [future.result() for future in group.futures]
+
+    Every task submitted to the executor from inside the ``with`` block, on
+    the same thread, joins the group. Leaving the block waits up to
+    ``timeout`` seconds for the group's tasks and then cancels any that
+    haven't started. If the block raises, they are cancelled straight away.
+
+    With ``after_response`` the group's tasks are held rather than
+    submitted, and are released once the response has been sent to the
+    client, using :meth:`~werkzeug.wrappers.Response.call_on_close`. Held
+    tasks are cancelled if the request ends with an unhandled exception, or
+    without a response being sent.
+
+    :param executor: The executor the group's tasks are submitted to.
+    :param timeout: Seconds to wait for the group's tasks when the block
+                    exits. ``None`` waits for all of them.
+    :param after_response: Whether to hold the group's tasks until the
+                           response has been sent.
+    """
+
+    def __init__(self, executor, timeout=None, after_response=False):
+        self.executor = executor
+        self.timeout = timeout
+        self.after_response = after_response
+        self.futures = []
+        self._held = [] if after_response else None
+        self._released = not after_response
+        self._scheduled = False
+        self._token = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        if self.after_response and not has_request_context():
+            raise RuntimeError('tasks can only be held until the response '
+                               'is sent inside a request context')
+        if has_request_context():
+            g.setdefault('_executor_task_groups', []).append(self)
+        self._thread = threading.current_thread()
+        self._token = _current_group.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _current_group.reset(self._token)
+        if exc_type is not None:
+            self.cancel_all()
+        elif self.after_response:
+            self._scheduled = True
+            after_this_request(self._after_request)
+        else:
+            self.wait_all(self.timeout)
+            self.cancel_all()
+
+    def __len__(self):
+        return len(self.futures)
+
+    def wait_all(self, timeout=None):
+        """Wait up to ``timeout`` seconds for every task in the group to
+        finish, see :func:`concurrent.futures.wait`.
+
+        :rtype: concurrent.futures._base.DoneAndNotDoneFutures
+        """
+        if not self._released:
+            raise RuntimeError('cannot wait for tasks that are held until '
+                               'the response is sent')
+        return concurrent.futures.wait(self.futures, timeout)
+
+    def cancel_all(self):
+        """Cancel every task in the group that hasn't started yet, and
+        return the number cancelled. Running tasks can't be interrupted."""
+        return sum(1 for future in self.futures
+                   if not future.done() and future.cancel())
+
+    def _hold(self, task, when=None):
+        # Returns False once the group has been released, in which case the
+        # caller should start the task itself
+        with self._lock:
+            if self._released:
+                return False
+            self._held.append((task, when))
+        return True
+
+    def _after_request(self, response):
+        response.call_on_close(self._release)
+        return response
+
+    def _release(self):
+        with self._lock:
+            held, self._held = self._held, []
+            self._released = True
+        for task, when in held:
+            try:
+                self.executor._start(task, when)
+            except RuntimeError:
+                # The executor was shut down while the response was sent
+                task.future.cancel()
+
+    def _teardown(self, exc=None):
+        # Runs at the end of the request, before the response is closed, to
+        # cancel tasks that will never be waited for or released
+        if exc is not None or (self.after_response and not self._scheduled):
+            self.cancel_all()
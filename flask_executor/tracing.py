@@ -0,0 +1,132 @@
+import functools
+import logging
+import threading
+import time
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def task_name(fn):
+    """The name under which ``fn`` is reported to hooks and introspection."""
+    return getattr(fn, '__qualname__', None) or repr(fn)
+
+
+class TaskSpan:
+    """Describes a single run of a task to the span hooks registered with
+    :meth:`~flask_executor.Executor.add_span_hooks`. Hooks run on the worker,
+    inside the task's copies of the Flask and context variable contexts, so
+    a tracer can open a child span of the request that submitted the task.
+
+    Times are Unix timestamps; ``started_at - submitted_at`` is the time the
+    task spent waiting for a worker. Hooks may keep their own state, such as
+    a tracer's span object, in ``data``.
+
+    :param fn: The submitted callable.
+    :param args: Positional arguments for the callable.
+    :param kwargs: Named arguments for the callable.
+    :param submitted_at: When the task was submitted.
+    """
+
+    __slots__ = ('name', 'fn', 'args', 'kwargs', 'submitted_at', 'started_at',
+                 'ended_at', 'exception', 'data')
+
+    def __init__(self, fn, args, kwargs, submitted_at):
+        self.name = task_name(fn)
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.submitted_at = submitted_at
+        self.started_at = None
+        self.ended_at = None
+        self.exception = None
+        self.data = {}
+
+    @property
+    def queued(self):
+        """Seconds the task waited between being submitted and starting."""
+        if self.started_at is None:
+            return None
+        return self.started_at - self.submitted_at
+
+    @property
+    def duration(self):
+        """Seconds the task ran for."""
+        if self.ended_at is None:
+            return None
+        return self.ended_at - self.started_at
+
+    def __repr__(self):
+        return '<TaskSpan {}>'.format(self.name)
+
+
+class SpanHooks:
+    """The ``start``, ``end`` and ``error`` callables of one
+    :meth:`~flask_executor.Executor.add_span_hooks` call. Exceptions raised
+    by hooks are logged rather than failing the task."""
+
+    __slots__ = ('start', 'end', 'error')
+
+    def __init__(self, start=None, end=None, error=None):
+        self.start = start
+        self.end = end
+        self.error = error
+
+
+def _call_hook(hook, *args):
+    if hook is None:
+        return
+    try:
+        hook(*args)
+    except Exception:
+        LOGGER.exception('exception calling span hook %r', hook)
+
+
+def traced(fn, hooks):
+    """Wrap ``fn`` so that every call runs the span hooks in ``hooks``: each
+    ``start`` hook before the call, each ``error`` hook if it raises, and
+    each ``end`` hook, in reverse order, once it has finished."""
+    submitted_at = time.time()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        span = TaskSpan(fn, args, kwargs, submitted_at)
+        span.started_at = time.time()
+        for hook in hooks:
+            _call_hook(hook.start, span)
+        try:
+            return fn(*args, **kwargs)
+        except BaseException as exc:
+            span.exception = exc
+            for hook in hooks:
+                _call_hook(hook.error, span, exc)
+            raise
+        finally:
+            span.ended_at = time.time()
+            for hook in reversed(hooks):
+                _call_hook(hook.end, span)
+
+    return wrapper
+
+
+def tracked(fn, running):
+    """Wrap ``fn`` so that, while it runs, ``running`` maps the worker
+    thread's identifier to the task's name and start time. A task run by a
+    work stealing worker that is waiting on another hides the outer one
+    until it finishes."""
+    name = task_name(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        ident = threading.get_ident()
+        outer = running.get(ident)
+        running[ident] = (name, time.time())
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if outer is None:
+                running.pop(ident, None)
+            else:
+                running[ident] = outer
+
+    return wrapper
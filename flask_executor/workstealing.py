@@ -0,0 +1,207 @@
+import collections
+import concurrent.futures
+import itertools
+import os
+import random
+import threading
+import time
+
+
+_counter = itertools.count()
+
+
+class _WorkItem:
+
+    __slots__ = ('future', 'fn', 'args', 'kwargs')
+
+    def __init__(self, future, fn, args, kwargs):
+        self.future = future
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+
+    def run(self):
+        if not self.future.set_running_or_notify_cancel():
+            return
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except BaseException as exc:
+            self.future.set_exception(exc)
+            # Break the reference cycle through the traceback
+            self = None
+        else:
+            self.future.set_result(result)
+
+
+class _Worker:
+
+    __slots__ = ('deque', 'thread')
+
+    def __init__(self):
+        self.deque = collections.deque()
+        self.thread = None
+
+
+class WorkStealingExecutor(concurrent.futures.Executor):
+    """A thread pool for nested and recursive tasks. Each worker has its
+    own deque: tasks submitted from a worker are pushed onto that worker's
+    deque and taken back newest first, while idle workers steal the oldest
+    tasks from the others. Tasks submitted from outside the pool go to a
+    shared queue.
+
+    A worker that waits for a task's result through
+    :meth:`help_until` runs pending tasks itself rather than blocking, so
+    divide-and-conquer jobs that submit subtasks and wait for them use
+    every worker and can't deadlock the pool. While helping, a worker may
+    run any pending task, and only checks its own future between tasks.
+
+    Worker threads are daemon threads; call :meth:`shutdown` to wait for
+    queued tasks before the interpreter exits.
+
+    :param max_workers: The maximum number of worker threads, defaulting to
+                        the same number as
+                        :class:`~concurrent.futures.ThreadPoolExecutor`.
+    :param thread_name_prefix: A prefix for worker thread names.
+    """
+
+    def __init__(self, max_workers=None, thread_name_prefix=''):
+        if max_workers is None:
+            max_workers = min(32, (os.cpu_count() or 1) + 4)
+        if max_workers <= 0:
+            raise ValueError("max_workers must be greater than 0")
+        self._max_workers = max_workers
+        self._thread_name_prefix = thread_name_prefix or \
+            'WorkStealingExecutor-{}'.format(next(_counter))
+        self._queue = collections.deque()
+        self._workers = []
+        self._threads = set()
+        self._local = threading.local()
+        self._condition = threading.Condition()
+        self._idle = 0
+        self._shutdown = False
+
+    def submit(self, fn, *args, **kwargs):
+        future = concurrent.futures.Future()
+        item = _WorkItem(future, fn, args, kwargs)
+        worker = getattr(self._local, 'worker', None)
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError('cannot schedule new futures after shutdown')
+            if worker is not None:
+                worker.deque.append(item)
+            else:
+                self._queue.append(item)
+            if self._idle:
+                self._condition.notify()
+            elif len(self._workers) < self._max_workers:
+                self._start_worker()
+        return future
+
+    submit.__doc__ = concurrent.futures.Executor.submit.__doc__
+
+    def help_until(self, future, timeout=None):
+        """Run pending tasks on the calling worker thread until ``future`` is
+        done or ``timeout`` seconds have passed, and return the time left of
+        the timeout. Threads outside the pool return straight away.
+        """
+        worker = getattr(self._local, 'worker', None)
+        if worker is None or future.done():
+            return timeout
+        end_time = None if timeout is None else time.monotonic() + timeout
+        wake = self._wake
+        future.add_done_callback(wake)
+        while not future.done():
+            item = self._next(worker)
+            if item is not None:
+                item.run()
+                del item
+                continue
+            with self._condition:
+                # Wait for another worker to finish the future, or for a
+                # new task to run in the meantime
+                if future.done() or self._has_work():
+                    continue
+                remaining = None if end_time is None else end_time - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._idle += 1
+                self._condition.wait(remaining)
+                self._idle -= 1
+        return None if end_time is None else max(0.0, end_time - time.monotonic())
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        with self._condition:
+            self._shutdown = True
+            if cancel_futures:
+                for queue in [self._queue] + [worker.deque for worker in self._workers]:
+                    while queue:
+                        try:
+                            item = queue.popleft()
+                        except IndexError:
+                            break
+                        item.future.cancel()
+            self._condition.notify_all()
+        if wait:
+            for thread in list(self._threads):
+                if thread is not threading.current_thread():
+                    thread.join()
+
+    shutdown.__doc__ = concurrent.futures.Executor.shutdown.__doc__
+
+    def _start_worker(self):
+        worker = _Worker()
+        worker.thread = threading.Thread(
+            target=self._work, args=(worker,),
+            name='{}_{}'.format(self._thread_name_prefix, len(self._workers))
+        )
+        worker.thread.daemon = True
+        self._workers.append(worker)
+        self._threads.add(worker.thread)
+        worker.thread.start()
+
+    def _wake(self, future):
+        with self._condition:
+            self._condition.notify_all()
+
+    def _has_work(self):
+        return bool(self._queue) or any(worker.deque for worker in self._workers)
+
+    def _next(self, worker):
+        # A worker's own tasks are taken newest first, to keep recursive jobs
+        # depth first, then shared tasks, then the oldest task of another
+        # worker, which is usually the largest piece of work left
+        try:
+            return worker.deque.pop()
+        except IndexError:
+            pass
+        try:
+            return self._queue.popleft()
+        except IndexError:
+            pass
+        workers = self._workers
+        start = random.randrange(len(workers))
+        for i in range(len(workers)):
+            victim = workers[(start + i) % len(workers)]
+            if victim is not worker:
+                try:
+                    return victim.deque.popleft()
+                except IndexError:
+                    pass
+        return None
+
+    def _work(self, worker):
+        self._local.worker = worker
+        while True:
+            item = self._next(worker)
+            if item is not None:
+                item.run()
+                del item
+                continue
+            with self._condition:
+                if self._has_work():
+                    continue
+                if self._shutdown:
+                    return
+                self._idle += 1
+                self._condition.wait()
+                self._idle -= 1
@@ -45,6 +45,11 @@ setuptools.setup(
         ':python_version == "2.7"': ['futures>=3.1.1'],
         'test': ['pytest', 'pytest-cov', 'codecov', 'flask-sqlalchemy'],
     },
+    entry_points={
+        'console_scripts': [
+            'flask-executor-worker = flask_executor.distributed:main',
+        ],
+    },
     test_suite='tests',
     cmdclass={
         'test': pytest
@@ -0,0 +1,134 @@
+import threading
+import time
+
+from flask import Flask
+import pytest
+
+from flask_executor import Executor, ExecutorOverloaded
+from flask_executor.admission import AdmissionController
+
+
+def test_admission_controller_limits():
+    controller = AdmissionController(max_inflight=10, shed_ratio=0.5)
+    controller.admit(4, 'low')
+    with pytest.raises(ExecutorOverloaded) as excinfo:
+        controller.admit(5, 'low')
+    assert excinfo.value.priority == 'low'
+    controller.admit(9)
+    with pytest.raises(ExecutorOverloaded):
+        controller.admit(10)
+    controller.admit(100, 'high')
+    with pytest.raises(ValueError):
+        AdmissionController()
+
+
+def test_admission_controller_queue_wait():
+    controller = AdmissionController(max_queue_wait=1.0, smoothing=1.0)
+    controller.record_wait(2.0)
+    with pytest.raises(ExecutorOverloaded):
+        controller.admit(1)
+    # Once nothing is in flight nothing can be waiting
+    controller.admit(0)
+    controller.admit(1)
+
+
+def test_executor_rejects_when_saturated(default_app):
+    default_app.config['EXECUTOR_MAX_WORKERS'] = 1
+    default_app.config['EXECUTOR_MAX_INFLIGHT'] = 2
+    default_app.config['EXECUTOR_SHED_RATIO'] = 0.5
+    executor = Executor(default_app)
+    release = threading.Event()
+
+    @executor.job(priority='low')
+    def low():
+        return 'low'
+
+    @executor.job(priority='high')
+    def high():
+        return 'high'
+
+    with default_app.test_request_context(''):
+        blocker = executor.submit(release.wait, 2)
+        with pytest.raises(ExecutorOverloaded):
+            low.submit()
+        queued = executor.submit(pow, 2, 3)
+        with pytest.raises(ExecutorOverloaded):
+            executor.submit(pow, 2, 3)
+        with pytest.raises(ExecutorOverloaded):
+            list(executor.map(pow, [2], [3]))
+        urgent = high.submit()
+        release.set()
+        assert blocker.result(timeout=2)
+        assert queued.result(timeout=2) == 8
+        assert urgent.result(timeout=2) == 'high'
+        time.sleep(0.05)
+        assert low.submit().result(timeout=2) == 'low'
+
+
+def test_executor_measures_queue_wait(default_app):
+    default_app.config['EXECUTOR_MAX_WORKERS'] = 1
+    default_app.config['EXECUTOR_MAX_QUEUE_WAIT'] = 0.05
+    executor = Executor(default_app)
+    executor._admission.smoothing = 1.0
+    with default_app.test_request_context(''):
+        executor.submit(time.sleep, 0.2)
+        waiting = [executor.submit(time.sleep, 0.1) for _ in range(2)]
+        waiting[0].result(timeout=2)
+        time.sleep(0.02)
+        assert executor._admission.queue_wait > 0.05
+        with pytest.raises(ExecutorOverloaded):
+            executor.submit(pow, 2, 3)
+        waiting[1].result(timeout=2)
+
+
+def test_overloaded_response():
+    app = Flask(__name__)
+    app.config['EXECUTOR_MAX_INFLIGHT'] = 1
+    app.config['EXECUTOR_RETRY_AFTER'] = 2.5
+    executor = Executor(app)
+    release = threading.Event()
+
+    @app.route('/')
+    def index():
+        executor.submit(release.wait, 2)
+        return 'OK'
+
+    client = app.test_client()
+    assert client.get('/').status_code == 200
+    response = client.get('/')
+    release.set()
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '3'
+
+
+def test_delayed_tasks_are_not_inflight(default_app):
+    default_app.config['EXECUTOR_MAX_INFLIGHT'] = 5
+    executor = Executor(default_app)
+    with default_app.test_request_context(''):
+        delayed = [executor.submit_after(3600, pow, 2, 3) for _ in range(5)]
+        assert executor.submit(pow, 2, 3).result(timeout=2) == 8
+    executor.shutdown()
+    assert all(future.cancelled() for future in delayed)
+
+
+def test_own_overloaded_handler_is_kept():
+    app = Flask(__name__)
+    app.config['EXECUTOR_MAX_INFLIGHT'] = 1
+
+    @app.errorhandler(ExecutorOverloaded)
+    def busy(exc):
+        return 'busy', 429
+
+    executor = Executor(app)
+    release = threading.Event()
+
+    @app.route('/')
+    def index():
+        executor.submit(release.wait, 2)
+        return 'OK'
+
+    client = app.test_client()
+    assert client.get('/').status_code == 200
+    response = client.get('/')
+    release.set()
+    assert response.status_code == 429
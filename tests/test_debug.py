@@ -0,0 +1,95 @@
+import threading
+
+import pytest
+from werkzeug.serving import make_server
+
+from flask_executor import Executor
+from flask_executor.debug import debug_blueprint
+
+
+def wait_for(event):
+    event.wait(5)
+
+
+@pytest.fixture
+def blocked(default_app):
+    default_app.config['EXECUTOR_MAX_WORKERS'] = 1
+    default_app.register_blueprint(debug_blueprint, url_prefix='/_executor')
+    executor = Executor(default_app)
+    release = threading.Event()
+    with default_app.test_request_context(''):
+        executor.submit_stored('blocked', wait_for, release)
+        executor.submit_stored('queued', pow, 2, 3)
+    yield executor
+    release.set()
+    executor.shutdown()
+
+
+def test_stats(blocked):
+    stats = blocked.stats()
+    assert stats['type'] == 'thread'
+    assert stats['max_workers'] == 1
+    assert stats['inflight'] == 2
+    assert stats['queued'] == 1
+    [running] = stats['running']
+    assert running['task'] == 'wait_for'
+    assert running['elapsed'] >= 0
+    assert stats['futures']['running'] == ['blocked']
+    assert stats['futures']['pending'] == ['queued']
+
+
+def test_stats_before_first_task(default_app):
+    stats = Executor(default_app).stats()
+    assert stats['max_workers'] is None
+    assert stats['inflight'] == 0
+    assert stats['running'] == []
+
+
+def test_profile(blocked):
+    profile = blocked.profile(seconds=0.1)
+    assert profile['samples'] > 0
+    [stack] = profile['stacks']
+    assert stack['task'] == 'wait_for'
+    assert stack['frames'][-1].startswith('wait (')
+
+
+def test_debug_blueprint(default_app, blocked):
+    client = default_app.test_client()
+    [stats] = client.get('/_executor/').get_json()['executors']
+    assert stats['futures']['running'] == ['blocked']
+    profile = client.get('/_executor/profile?seconds=0.1').get_json()
+    assert profile['stacks'][0]['task'] == 'wait_for'
+    assert client.get('/_executor/profile?executor=missing').status_code == 404
+
+
+def test_cannot_profile_processes(default_app):
+    default_app.config['EXECUTOR_TYPE'] = 'process'
+    executor = Executor(default_app)
+    with pytest.raises(TypeError):
+        executor.profile(seconds=0)
+
+
+def test_commands(default_app, blocked):
+    Executor(default_app, name='reports')
+    runner = default_app.test_cli_runner()
+    result = runner.invoke(args=['executor', 'list'])
+    assert result.output.splitlines() == [
+        'default: thread, 1 workers',
+        "'reports': thread, default workers",
+    ]
+    server = make_server('127.0.0.1', 0, default_app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        url = 'http://127.0.0.1:{}/_executor'.format(server.server_port)
+        result = runner.invoke(args=['executor', 'stats', '--url', url])
+        assert 'default: thread, 1 workers, 2 in flight, 1 queued' in result.output
+        assert 'running wait_for for ' in result.output
+        assert 'pending queued' in result.output
+        result = runner.invoke(args=['executor', 'profile', '--url', url, '--seconds', '0.1'])
+        assert 'samples of wait_for:' in result.output
+    finally:
+        server.shutdown()
+        thread.join()
+    result = runner.invoke(args=['executor', 'stats', '--url', 'http://127.0.0.1:1'])
+    assert result.exit_code != 0
@@ -0,0 +1,155 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+from flask import Flask, current_app
+
+from flask_executor import Executor
+from flask_executor.distributed import (
+    DistributedExecutor, SQLiteBroker, Worker, make_broker
+)
+
+
+executor = Executor(name='distributed')
+
+
+@executor.job
+def add(x, y):
+    return x + y
+
+
+def app_name():
+    return current_app.name
+
+
+def fail():
+    raise ValueError('boom')
+
+
+def unpicklable():
+    return lambda: None
+
+
+def create_app(broker_url=None):
+    app = Flask(__name__)
+    app.config['DISTRIBUTED_EXECUTOR_TYPE'] = 'distributed'
+    app.config['DISTRIBUTED_EXECUTOR_BROKER_URL'] = broker_url or os.environ['TEST_BROKER_URL']
+    app.config['DISTRIBUTED_EXECUTOR_BROKER_POLL_INTERVAL'] = 0.01
+    executor.init_app(app)
+    return app
+
+
+@pytest.fixture
+def broker_url(tmp_path):
+    return 'sqlite:///' + str(tmp_path / 'tasks.db')
+
+
+@pytest.fixture
+def worker(broker_url):
+    worker = executor.worker(create_app(broker_url))
+    thread = threading.Thread(target=worker.run)
+    thread.start()
+    yield worker
+    worker.stop()
+    thread.join()
+    executor.shutdown()
+
+
+def test_submit(worker):
+    with worker.app.test_request_context(''):
+        assert executor.submit(pow, 2, 3).result(timeout=5) == 8
+        assert executor.submit(app_name).result(timeout=5) == 'tests.test_distributed'
+        assert isinstance(executor.submit(fail).exception(timeout=5), ValueError)
+        assert isinstance(executor.submit(unpicklable).exception(timeout=5), TypeError)
+
+
+def test_jobs_and_collections(worker):
+    with worker.app.test_request_context(''):
+        assert add.submit(1, 2).result(timeout=5) == 3
+        assert list(add.map([1, 2], [3, 4], timeout=5)) == [4, 6]
+        add.submit_stored('sum', 2, 2)
+        assert executor.futures.pop('sum').result(timeout=5) == 4
+
+
+def test_running_state(broker_url):
+    broker = make_broker(broker_url)
+    pool = DistributedExecutor(broker, poll_interval=0.01)
+    future = pool.submit(time.sleep, 0.2)
+    worker = Worker(broker)
+    thread = threading.Thread(target=worker.run, args=(True,))
+    thread.start()
+    deadline = time.monotonic() + 2
+    while not future.running() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert future.running()
+    assert not future.cancel()
+    assert future.result(timeout=5) is None
+    thread.join()
+    pool.shutdown()
+    with pytest.raises(RuntimeError):
+        pool.submit(pow, 2, 3)
+
+
+def test_cancel(broker_url):
+    create_app(broker_url)
+    future = executor.submit(pow, 2, 3)
+    assert future.cancel()
+    assert executor._self.broker.claim('distributed', 'test') is None
+    executor.shutdown()
+
+
+def test_configuration(broker_url):
+    app = Flask(__name__)
+    app.config['EXECUTOR_TYPE'] = 'distributed'
+    with pytest.raises(ValueError):
+        Executor(app)
+    with pytest.raises(TypeError):
+        Executor(Flask(__name__)).worker(app)
+    with pytest.raises(ValueError):
+        SQLiteBroker(':memory:')
+    broker = make_broker(broker_url)
+    assert make_broker(broker) is broker
+    with pytest.raises(ValueError):
+        make_broker('sqlite://tasks.db')
+    with pytest.raises(ValueError):
+        SQLiteBroker(broker.path, lease=0)
+
+
+def test_lease(broker_url):
+    broker = make_broker(broker_url, lease=0.1)
+    broker.put('default', 'task', b'payload')
+    assert broker.claim('default', 'crashed') == ('task', b'payload')
+    assert broker.claim('default', 'other') is None
+    time.sleep(0.15)
+    assert broker.claim('default', 'other') == ('task', b'payload')
+    assert make_broker(broker_url).claim('default', 'another') is None
+
+
+def test_worker_command(broker_url):
+    create_app(broker_url)
+    futures = [add.submit(i, i) for i in range(5)]
+    env = dict(os.environ, TEST_BROKER_URL=broker_url)
+    subprocess.run(
+        [sys.executable, '-m', 'flask_executor.distributed', 'tests.test_distributed:create_app',
+         '--executor', 'distributed', '--threads', '2', '--burst'],
+        env=env, check=True, timeout=30,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    assert [future.result(timeout=5) for future in futures] == [0, 2, 4, 6, 8]
+    executor.shutdown()
+
+
+def test_flask_worker_command(broker_url):
+    app = create_app(broker_url)
+    future = add.submit(2, 3)
+    result = app.test_cli_runner().invoke(
+        args=['executor', 'worker', '--executor', 'distributed', '--burst']
+    )
+    assert result.exit_code == 0, result.output
+    assert future.result(timeout=5) == 5
+    result = app.test_cli_runner().invoke(args=['executor', 'worker', '--burst'])
+    assert 'No executor named default' in result.output
+    executor.shutdown()
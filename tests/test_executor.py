@@ -1,15 +1,22 @@
 import concurrent
 import concurrent.futures
 import logging
+import os
 import random
+import signal
+import subprocess
+import sys
+import threading
 import time
+from datetime import datetime, timedelta
 from threading import local
 
 import pytest
 from flask import current_app, g, request
 
-from flask_executor import Executor
+from flask_executor import Executor, RetryPolicy
 from flask_executor.executor import propagate_exceptions_callback
+from flask_executor.helpers import InstanceProxy, interpreter_pool
 
 
 # Reusable functions for tests
@@ -374,3 +381,580 @@ def test_sqlalchemy(default_app, caplog):
                 future.result()
                 assert 'checked out from pool' in caplog.text
                 assert 'being returned to pool' in caplog.text
+
+
+def test_job_rate_limit(default_app):
+    executor = Executor(default_app)
+
+    @executor.job(rate='20/s', burst=2)
+    def decorated(n):
+        return time.monotonic()
+
+    with default_app.test_request_context(''):
+        submitted = time.monotonic()
+        futures = [decorated.submit(i) for i in range(4)]
+    starts = sorted(future.result() for future in futures)
+    # The first two tasks start immediately, then one every 50ms
+    assert starts[2] - submitted >= 0.045
+    assert starts[3] - submitted >= 0.095
+    assert len(executor.scheduler) == 0
+
+
+def test_job_rate_limit_does_not_hold_workers(default_app):
+    default_app.config['EXECUTOR_MAX_WORKERS'] = 1
+    executor = Executor(default_app)
+
+    @executor.job(rate='1/h')
+    def limited():
+        return 'limited'
+
+    with default_app.test_request_context(''):
+        first = limited.submit()
+        second = limited.submit()
+        assert first.result() == 'limited'
+        # The throttled task waits in the scheduler, so the only worker is
+        # free to run other work
+        assert executor.submit(fib, 5).result(timeout=1) == fib(5)
+    assert not second.done()
+    assert second.cancel()
+
+
+def test_executor_rate_limit(default_app):
+    default_app.config['EXECUTOR_RATE_LIMIT'] = '20/s'
+    executor = Executor(default_app)
+    with default_app.test_request_context(''):
+        results = list(executor.map(fib, range(1, 4)))
+        submitted = time.monotonic()
+        futures = [executor.submit(time.monotonic) for _ in range(3)]
+    assert results == [fib(i) for i in range(1, 4)]
+    starts = sorted(future.result() for future in futures)
+    assert starts[2] - submitted >= 0.095
+
+
+def test_job_rate_limit_map(default_app):
+    executor = Executor(default_app)
+
+    @executor.job(rate='50/s')
+    def decorated(n):
+        return fib(n)
+
+    with default_app.test_request_context(''):
+        results = decorated.map(range(5), timeout=5)
+    assert list(results) == [fib(i) for i in range(5)]
+
+
+def test_rate_limited_default_done_callback(default_app):
+    executor = Executor(default_app)
+    executor.add_default_done_callback(lambda future: setattr(future, 'test', 'test'))
+
+    @executor.job(rate='1/s')
+    def decorated(n):
+        return fib(n)
+
+    with default_app.test_request_context(''):
+        futures = [decorated.submit(5) for _ in range(2)]
+    concurrent.futures.wait(futures)
+    assert all(hasattr(future, 'test') for future in futures)
+
+
+def test_job_retry(default_app):
+    executor = Executor(default_app)
+    attempts = []
+
+    @executor.job(retry=RetryPolicy(max_attempts=3, backoff=0.01))
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise IOError('try again')
+        return len(attempts)
+
+    with default_app.test_request_context(''):
+        future = flaky.submit()
+    assert future.result(timeout=5) == 3
+
+
+def test_job_retry_gives_up(default_app):
+    executor = Executor(default_app)
+    callbacks = []
+    executor.add_default_done_callback(callbacks.append)
+    attempts = []
+
+    @executor.job(retry=RetryPolicy(max_attempts=2, backoff=0.01, retry_on=(IOError,)))
+    def failing(exc_type):
+        attempts.append(1)
+        raise exc_type()
+
+    with default_app.test_request_context(''):
+        future = failing.submit(IOError)
+        with pytest.raises(IOError):
+            future.result(timeout=5)
+        assert len(attempts) == 2
+        # Exceptions that aren't retried resolve on the first attempt
+        with pytest.raises(ValueError):
+            failing.submit(ValueError).result(timeout=5)
+    assert len(attempts) == 3
+    # The future only resolves once, on the final outcome
+    assert len(callbacks) == 2
+
+
+def test_executor_retry_config(app):
+    app.config['EXECUTOR_RETRY_MAX_ATTEMPTS'] = 2
+    app.config['EXECUTOR_RETRY_BACKOFF'] = 0.01
+    executor = Executor(app)
+    with app.test_request_context(''):
+        assert executor.submit(fib, 5).result(timeout=5) == fib(5)
+        future = executor.submit(fail)
+        with pytest.raises(NameError):
+            future.result(timeout=5)
+        assert list(executor.map(fib, range(3), timeout=5)) == [fib(i) for i in range(3)]
+
+
+def test_submit_after(app):
+    executor = Executor(app)
+    with app.test_request_context(''):
+        start = time.monotonic()
+        future = executor.submit_after(0.1, fib, 5)
+        assert not future.done()
+        assert future.result(timeout=5) == fib(5)
+    assert time.monotonic() - start >= 0.1
+
+
+def test_submit_at_context(default_app):
+    test_value = random.randint(1, 101)
+    executor = Executor(default_app)
+    with default_app.test_request_context(''):
+        g.test_value = test_value
+        future = executor.submit_at(datetime.now() + timedelta(seconds=0.05), g_context_test_value)
+    assert future.result(timeout=5) == test_value
+
+
+def test_cancel_delayed_submit(default_app):
+    executor = Executor(default_app)
+    with default_app.test_request_context(''):
+        future = executor.submit_after(timedelta(hours=1), fib, 5)
+    assert len(executor.scheduler) == 1
+    assert future.cancel()
+    assert len(executor.scheduler) == 0
+
+
+def test_schedule_every(default_app):
+    executor = Executor(default_app)
+    runs = []
+
+    @executor.job
+    def tick(value):
+        runs.append(value)
+
+    with default_app.test_request_context(''):
+        periodic_task = tick.schedule_every(0.05, 'tick')
+    time.sleep(0.28)
+    assert periodic_task.cancel()
+    concurrent.futures.wait([periodic_task.future])
+    count = len(runs)
+    assert 3 <= count <= 6
+    time.sleep(0.1)
+    assert len(runs) == count
+
+
+def test_schedule_every_skips_overlapping_runs(default_app):
+    executor = Executor(default_app)
+    runs = []
+
+    def slow():
+        runs.append(1)
+        time.sleep(0.25)
+
+    with default_app.test_request_context(''):
+        periodic_task = executor.schedule_every(0.05, slow)
+    time.sleep(0.3)
+    periodic_task.cancel()
+    assert len(runs) == 1
+
+
+def test_job_submit_after(default_app):
+    executor = Executor(default_app)
+
+    @executor.job
+    def decorated(n):
+        return fib(n)
+
+    with default_app.test_request_context(''):
+        assert decorated.submit_after(0.01, 5).result(timeout=5) == fib(5)
+        assert decorated.submit_at(time.time(), 5).result(timeout=5) == fib(5)
+
+
+def test_job_rate_limit_does_not_delay_executor_rate_limit(default_app):
+    default_app.config['EXECUTOR_RATE_LIMIT'] = '100/s'
+    executor = Executor(default_app)
+
+    @executor.job(rate='1/h')
+    def limited():
+        return 'limited'
+
+    with default_app.test_request_context(''):
+        throttled = [limited.submit() for _ in range(300)]
+        start = time.monotonic()
+        assert executor.submit(fib, 5).result(timeout=2) == fib(5)
+        # Waiting tasks of the throttled job haven't taken the executor's slots
+        assert time.monotonic() - start < 0.1
+    assert all(future.cancel() for future in throttled[1:])
+
+
+def test_submit_at_in_the_past_is_rate_limited(default_app):
+    executor = Executor(default_app)
+
+    @executor.job(rate='1/h')
+    def limited():
+        return time.monotonic()
+
+    with default_app.test_request_context(''):
+        futures = [limited.submit_at(0) for _ in range(3)]
+        assert futures[0].result(timeout=2)
+    time.sleep(0.1)
+    assert sum(future.done() for future in futures) == 1
+    for future in futures:
+        future.cancel()
+
+
+def test_submit_at_in_the_past_runs_in_submission_order(default_app):
+    executor = Executor(default_app)
+
+    @executor.job(rate='1/h')
+    def limited():
+        return time.monotonic()
+
+    with default_app.test_request_context(''):
+        first = limited.submit_at(time.time() - 1)
+        second = limited.submit_at(time.time() - 2)
+        assert first.result(timeout=2)
+        assert not second.done()
+        second.cancel()
+
+
+def test_retryable_task_pending_until_started(default_app):
+    default_app.config['EXECUTOR_MAX_WORKERS'] = 1
+    default_app.config['EXECUTOR_RETRY_MAX_ATTEMPTS'] = 2
+    executor = Executor(default_app)
+    ran = []
+    with default_app.test_request_context(''):
+        blocker = executor.submit(time.sleep, 0.2)
+        queued = executor.submit(ran.append, 1)
+        assert not queued.running()
+        assert queued.cancel()
+        assert blocker.result(timeout=5) is None
+    time.sleep(0.05)
+    assert ran == []
+
+
+def test_submit_with_retry(default_app):
+    executor = Executor(default_app)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise IOError('try again')
+        return len(attempts)
+
+    with default_app.test_request_context(''):
+        future = executor.submit_with_retry(RetryPolicy(max_attempts=2, backoff=0.01), flaky)
+        assert future.result(timeout=5) == 2
+        with pytest.raises(NameError):
+            executor.submit_with_retry(1, fail).result(timeout=5)
+
+
+def test_drain(default_app):
+    default_app.config['EXECUTOR_MAX_WORKERS'] = 1
+    executor = Executor(default_app)
+    reports = []
+    executor.add_drain_callback(reports.append)
+    with default_app.test_request_context(''):
+        finished = executor.submit(fib, 5)
+        concurrent.futures.wait([finished])
+        running = executor.submit(time.sleep, 0.3)
+        queued = [executor.submit(fib, i) for i in range(3)]
+        delayed = executor.submit_after(60, fib, 5)
+        periodic_task = executor.schedule_every(60, fib, 5)
+        time.sleep(0.05)
+        report = executor.drain(timeout=0.05)
+        with pytest.raises(RuntimeError):
+            executor.submit(fib, 5)
+    assert reports == [report]
+    assert report.completed == 0
+    assert [task.future for task in report.abandoned] == [running]
+    assert sorted(task.args for task in report.dropped) == [(0,), (1,), (2,), (5,)]
+    assert all(task.fn is fib for task in report.dropped)
+    assert all(future.cancelled() for future in queued + [delayed])
+    assert periodic_task.cancelled
+    assert running.result(timeout=5) is None
+
+
+def test_drain_waits_for_tasks(app):
+    app.config['EXECUTOR_SHUTDOWN_TIMEOUT'] = 5
+    executor = Executor(app)
+    with app.test_request_context(''):
+        futures = [executor.submit(time.sleep, 0.1) for _ in range(3)]
+    report = executor.drain()
+    assert report.completed == 3
+    assert report.dropped == report.abandoned == []
+    assert all(future.done() for future in futures)
+
+
+def test_drain_skips_waiting_tasks(app):
+    app.config['EXECUTOR_SHUTDOWN_TIMEOUT'] = 2
+    app.config['EXECUTOR_RETRY_MAX_ATTEMPTS'] = 3
+    app.config['EXECUTOR_RETRY_BACKOFF'] = 3600
+    executor = Executor(app)
+
+    def fail():
+        raise ValueError()
+
+    with app.test_request_context(''):
+        delayed = executor.submit_after(3600, fib, 5)
+        retried = executor.submit(fail)
+        quick = executor.submit(time.sleep, 0.1)
+    deadline = time.monotonic() + 5
+    # Wait for the first attempt to fail, and the retry to be scheduled
+    while getattr(executor._waiting.get(retried), 'attempt', 0) < 1 \
+            and time.monotonic() < deadline:
+        time.sleep(0.01)
+    start = time.monotonic()
+    report = executor.drain()
+    assert time.monotonic() - start < 1
+    assert report.completed == 1
+    assert {task.future for task in report.dropped} == {delayed, retried}
+    assert delayed.cancelled() and quick.done()
+    with pytest.raises(concurrent.futures.CancelledError):
+        retried.result()
+
+
+def test_drain_on_signals(default_app):
+    default_app.config['EXECUTOR_DRAIN_SIGNALS'] = ['SIGUSR1']
+    previous = signal.signal(signal.SIGUSR1, lambda signum, frame: None)
+    try:
+        executor = Executor(default_app)
+        os.kill(os.getpid(), signal.SIGUSR1)
+        time.sleep(0.05)
+        assert executor._draining
+    finally:
+        signal.signal(signal.SIGUSR1, previous)
+
+
+def test_shutdown_cancels_scheduled_tasks(default_app):
+    executor = Executor(default_app)
+    with default_app.test_request_context(''):
+        delayed = executor.submit_after(60, fib, 5)
+    executor.shutdown()
+    assert delayed.cancelled()
+
+
+preloaded = {}
+
+
+def load_preloaded():
+    preloaded['pid'] = os.getpid()
+    preloaded['app'] = current_app.name
+
+
+def get_preloaded():
+    return dict(preloaded), os.getpid()
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='fork is not available')
+def test_prefork_executor(default_app):
+    preloaded.clear()
+    default_app.config['EXECUTOR_TYPE'] = 'prefork'
+    default_app.config['EXECUTOR_MAX_WORKERS'] = 2
+    default_app.config['EXECUTOR_PRELOAD'] = 'tests.test_executor:load_preloaded'
+    executor = Executor()
+    calls = []
+    executor.preload(lambda: calls.append(current_app.name))
+    executor.init_app(default_app)
+    assert isinstance(executor._self, concurrent.futures.ProcessPoolExecutor)
+    assert calls == [default_app.name]
+    # Workers are forked during init_app, after the preload hooks have run
+    assert len(executor._self._processes) == 2
+    with default_app.test_request_context(''):
+        data, pid = executor.submit(get_preloaded).result(timeout=10)
+    assert data == {'pid': os.getpid(), 'app': default_app.name}
+    assert pid != os.getpid()
+    executor.shutdown()
+
+
+hybrid_executor = Executor(name='hybrid')
+
+
+@hybrid_executor.job(kind='cpu')
+def cpu_job(n):
+    return fib(n), os.getpid()
+
+
+@hybrid_executor.job
+def io_job():
+    return os.getpid()
+
+
+@hybrid_executor.job(kind='auto')
+def auto_job(n):
+    return fib(n), os.getpid()
+
+
+def test_hybrid_executor(default_app):
+    default_app.config['HYBRID_EXECUTOR_TYPE'] = 'hybrid'
+    default_app.config['HYBRID_EXECUTOR_PROCESS_MAX_WORKERS'] = 1
+    hybrid_executor.init_app(default_app)
+    callbacks = []
+    hybrid_executor.add_default_done_callback(callbacks.append)
+    try:
+        assert isinstance(hybrid_executor._self, concurrent.futures.ThreadPoolExecutor)
+        with default_app.test_request_context(''):
+            result, pid = cpu_job.submit(10).result(timeout=10)
+            assert result == fib(10)
+            assert pid != os.getpid()
+            assert io_job.submit().result(timeout=5) == os.getpid()
+            assert [r for r, _ in cpu_job.map(range(3), timeout=10)] == [fib(i) for i in range(3)]
+            hybrid_executor.submit_stored('cpu', cpu_job.fn, 5)
+        assert 'cpu' in hybrid_executor.futures._futures
+        assert len(callbacks) >= 2
+    finally:
+        hybrid_executor.shutdown()
+
+
+@hybrid_executor.job(kind='cpu')
+def cpu_request_job():
+    return request.path, threading.current_thread().name
+
+
+def test_hybrid_executor_without_gil(default_app, monkeypatch):
+    monkeypatch.setattr('flask_executor.executor.gil_enabled', lambda: False)
+    default_app.config['HYBRID_EXECUTOR_TYPE'] = 'hybrid'
+    hybrid_executor.init_app(default_app)
+    try:
+        with default_app.test_request_context('/report'):
+            path, thread_name = cpu_request_job.submit().result(timeout=5)
+        assert path == '/report'
+        assert thread_name.startswith('hybrid-executor-cpu')
+        assert isinstance(hybrid_executor._process_pool, concurrent.futures.ThreadPoolExecutor)
+        assert hybrid_executor._process_pool._max_workers == (
+            getattr(os, 'process_cpu_count', os.cpu_count)() or 1
+        )
+    finally:
+        hybrid_executor.shutdown()
+
+
+interpreter_executor = Executor(name='interpreter')
+
+
+@interpreter_executor.job
+def interpreter_job(n):
+    return fib(n)
+
+
+@pytest.mark.skipif(interpreter_pool() is None, reason='requires InterpreterPoolExecutor')
+def test_interpreter_executor(default_app):
+    default_app.config['INTERPRETER_EXECUTOR_TYPE'] = 'interpreter'
+    interpreter_executor.init_app(default_app)
+    try:
+        with default_app.test_request_context(''):
+            assert interpreter_executor.submit(pow, 2, 3).result(timeout=10) == 8
+            assert interpreter_job.submit(10).result(timeout=10) == fib(10)
+            assert list(interpreter_job.map([5, 6], timeout=10)) == [fib(5), fib(6)]
+    finally:
+        interpreter_executor.shutdown()
+
+
+@pytest.mark.skipif(interpreter_pool() is not None, reason='InterpreterPoolExecutor is available')
+def test_interpreter_executor_unavailable(default_app):
+    default_app.config['EXECUTOR_TYPE'] = 'interpreter'
+    with pytest.raises(ValueError):
+        Executor(default_app)
+
+
+def test_hybrid_executor_auto_routing(default_app):
+    default_app.config['HYBRID_EXECUTOR_TYPE'] = 'hybrid'
+    hybrid_executor.init_app(default_app)
+    try:
+        assert not auto_job.cpu_bound
+        with default_app.test_request_context(''):
+            for _ in range(auto_job.AUTO_SAMPLES):
+                assert auto_job.submit(20).result(timeout=10)[1] == os.getpid()
+            assert auto_job.samples == auto_job.AUTO_SAMPLES
+            # Other threads can inflate wall time, so pin the measured ratio
+            auto_job.wall_time = auto_job.cpu_time
+            assert auto_job.cpu_bound
+            assert auto_job.submit(20).result(timeout=10)[1] != os.getpid()
+    finally:
+        hybrid_executor.shutdown()
+
+
+def test_pool_created_on_first_submit(default_app):
+    threads = threading.active_count()
+    executor = Executor(default_app)
+    assert InstanceProxy._self.fget(executor) is None
+    assert threading.active_count() == threads
+    with default_app.test_request_context(''):
+        assert executor.submit(pow, 2, 3).result() == 8
+    assert isinstance(InstanceProxy._self.fget(executor), concurrent.futures.ThreadPoolExecutor)
+
+
+def test_shutdown_unused_executor(default_app):
+    executor = Executor(default_app)
+    executor.shutdown()
+    assert InstanceProxy._self.fget(executor) is None
+
+
+def test_prestart(default_app):
+    default_app.config['EXECUTOR_MAX_WORKERS'] = 3
+    executor = Executor(default_app)
+    executor.prestart(2)
+    assert len(executor._threads) == 2
+    executor.prestart()
+    assert len(executor._threads) == 3
+    executor.shutdown()
+
+
+STARTUP_IMPORTS = """
+import sys
+import flask
+app = flask.Flask('startup')
+before = set(sys.modules)
+from flask_executor import Executor
+executor = Executor(app)
+print(' '.join(sorted(set(sys.modules) - before)))
+"""
+
+
+def test_startup_imports():
+    # Modules for optional features and executor types must only be imported
+    # once they are used, so that importing and initialising stays cheap
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+    output = subprocess.check_output([sys.executable, '-c', STARTUP_IMPORTS], env=env)
+    imported = set(output.decode().split())
+    assert {module for module in imported if module.startswith('flask_executor')} == {
+        'flask_executor', 'flask_executor.admission', 'flask_executor.cli',
+        'flask_executor.debug', 'flask_executor.executor', 'flask_executor.futures',
+        'flask_executor.helpers', 'flask_executor.retry', 'flask_executor.taskgroup',
+        'flask_executor.tracing',
+    }
+    assert not imported & {'multiprocessing', 'concurrent.futures.thread',
+                           'concurrent.futures.process', 'queue', 'sqlite3'}
+
+
+def test_work_stealing_recursive_job(default_app):
+    default_app.config['EXECUTOR_TYPE'] = 'work_stealing'
+    default_app.config['EXECUTOR_MAX_WORKERS'] = 2
+    executor = Executor(default_app)
+
+    @executor.job
+    def fib_job(n):
+        if n <= 2:
+            return 1
+        a = fib_job.submit(n - 1)
+        b = fib_job.submit(n - 2)
+        return a.result() + b.result()
+
+    with default_app.test_request_context(''):
+        assert fib_job.submit(12).result(timeout=10) == fib(12)
+    assert len(executor._threads) <= 2
+    executor.shutdown()
@@ -1,10 +1,16 @@
 import concurrent.futures
+import gc
+import os
+import threading
 import time
+import traceback
+import weakref
 
 import pytest
+from flask import request
 
 from flask_executor import Executor
-from flask_executor.futures import FutureCollection, FutureProxy
+from flask_executor.futures import CompletedFuture, FutureCollection, FutureProxy, SpilledResult
 from flask_executor.helpers import InstanceProxy
 
 
@@ -95,3 +101,227 @@ def test_instance_proxy():
     assert 'TestProxy' in repr(x)
     assert 'Future' in repr(x)
 
+
+def test_add_done_callbacks_share_context(default_app, monkeypatch):
+    executor = Executor(default_app)
+    prepare_fn = executor._prepare_fn
+    force_copies = []
+
+    def counting_prepare_fn(fn, force_copy=False):
+        if force_copy:
+            force_copies.append(fn)
+        return prepare_fn(fn, force_copy=force_copy)
+
+    monkeypatch.setattr(executor, '_prepare_fn', counting_prepare_fn)
+    results = []
+    with default_app.test_request_context('/test'):
+        future = executor.submit(time.sleep, 0.2)
+        for i in range(3):
+            future.add_done_callback(
+                lambda future, i=i: results.append((i, request.path))
+            )
+    concurrent.futures.wait([future])
+    assert results == [(0, '/test'), (1, '/test'), (2, '/test')]
+    assert len(force_copies) == 1
+
+
+def test_add_done_callback_after_completion(default_app):
+    executor = Executor(default_app)
+    results = []
+    with default_app.test_request_context('/test'):
+        future = executor.submit(pow, 2, 4)
+        concurrent.futures.wait([future])
+        future.add_done_callback(lambda future: results.append(request.path))
+    assert results == ['/test']
+
+
+def test_done_callback_exceptions_are_isolated(default_app, caplog):
+    executor = Executor(default_app)
+    results = []
+
+    def fail(future):
+        raise ValueError('boom')
+
+    executor.add_default_done_callback(fail)
+    executor.add_default_done_callback(results.append)
+    with default_app.test_request_context(''):
+        future = executor.submit(time.sleep, 0.1)
+        future.add_done_callback(fail)
+        future.add_done_callback(results.append)
+        done = threading.Event()
+        future.add_done_callback(lambda future: done.set())
+    assert done.wait(5)
+    assert len(results) == 2
+    assert 'exception calling callback' in caplog.text
+
+
+def test_callback_workers(default_app):
+    default_app.config['EXECUTOR_CALLBACK_WORKERS'] = 1
+    executor = Executor(default_app)
+    threads = []
+    done = threading.Event()
+    executor.add_default_done_callback(lambda future: threads.append(threading.current_thread().name))
+    with default_app.test_request_context(''):
+        future = executor.submit(threading.current_thread)
+        future.add_done_callback(lambda future: done.set())
+    assert done.wait(5)
+    assert threads[0] != future.result().name
+    assert threads[0].startswith('executor-callbacks')
+
+
+def test_no_dispatcher_without_callbacks(default_app):
+    executor = Executor(default_app)
+    with default_app.test_request_context(''):
+        future = executor.submit(time.sleep, 0.1)
+    assert future._callbacks is None
+    callback_count = len(future._self._done_callbacks)
+    results = []
+    with default_app.test_request_context('/test'):
+        future.add_done_callback(lambda future: results.append(request.path))
+        future.add_done_callback(lambda future: results.append(request.path))
+    assert len(future._self._done_callbacks) == callback_count + 1
+    concurrent.futures.wait([future])
+    time.sleep(0.05)
+    assert results == ['/test', '/test']
+
+
+def test_spilled_stored_result(default_app):
+    default_app.config['EXECUTOR_RESULT_SPILL_BYTES'] = 1024
+    executor = Executor(default_app)
+    with default_app.test_request_context(''):
+        executor.submit_stored('small', bytes, 10)
+        executor.submit_stored('large', bytes, 4096)
+        large_unstored = executor.submit(bytes, 4096)
+    assert executor.futures.result('small', timeout=2) == bytes(10)
+    assert executor.futures.result('large', timeout=2) == bytes(4096)
+    assert large_unstored.result(timeout=2) == bytes(4096)
+    future = executor.futures.pop('large')
+    spilled = future._self.result()
+    assert isinstance(spilled, SpilledResult)
+    assert spilled.size > 4096
+    assert os.path.exists(spilled.path)
+    assert future.result() == bytes(4096)
+    path = spilled.path
+    del future, spilled
+    gc.collect()
+    assert not os.path.exists(path)
+
+
+def test_spilled_result_in_callbacks(default_app):
+    default_app.config['EXECUTOR_RESULT_SPILL_BYTES'] = 1024
+    executor = Executor(default_app)
+    results = []
+    done = threading.Event()
+    executor.add_default_done_callback(lambda future: results.append(future.result()))
+    with default_app.test_request_context(''):
+        future = executor.submit_stored('large', bytes, 4096)
+        future.add_done_callback(lambda future: results.append(future.result()))
+        future.add_done_callback(lambda future: done.set())
+    assert done.wait(5)
+    with default_app.test_request_context(''):
+        future.add_done_callback(lambda future: results.append(future.result()))
+    assert results == [bytes(4096)] * 3
+
+
+def test_spilled_result_from_process(default_app, tmpdir):
+    default_app.config['EXECUTOR_TYPE'] = 'process'
+    default_app.config['EXECUTOR_RESULT_SPILL_BYTES'] = 1024
+    default_app.config['EXECUTOR_RESULT_SPILL_DIR'] = str(tmpdir)
+    executor = Executor(default_app)
+    with default_app.test_request_context(''):
+        executor.submit_stored('large', bytes, 4096)
+    future = executor.futures.pop('large')
+    assert future.result(timeout=10) == bytes(4096)
+    assert len(tmpdir.listdir()) == 1
+    del future
+    gc.collect()
+    assert tmpdir.listdir() == []
+    executor.shutdown()
+
+
+def test_futures_by_state():
+    futures = FutureCollection()
+    states = {}
+    for state in ('pending', 'running', 'cancelled', 'failed', 'finished'):
+        states[state] = concurrent.futures.Future()
+        futures.add(state, states[state])
+    states['running'].set_running_or_notify_cancel()
+    states['cancelled'].cancel()
+    states['failed'].set_exception(ValueError())
+    states['finished'].set_result(None)
+    assert futures.by_state() == {state: [state] for state in states}
+
+
+def test_compact_retention(default_app):
+    default_app.config['EXECUTOR_FUTURES_RETENTION'] = 'compact'
+    executor = Executor(default_app)
+
+    def fail(payload):
+        raise ValueError('boom')
+
+    with default_app.test_request_context(''):
+        finished = executor.submit_stored('finished', pow, 2, 3)
+        failed = executor.submit_stored('failed', fail, bytearray(1024))
+        cancelled = concurrent.futures.Future()
+        executor.futures.add('cancelled', cancelled)
+        cancelled.cancel()
+    finished.result(timeout=2)
+    deadline = time.monotonic() + 2
+    while executor.futures.by_state()['failed'] != ['failed'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert executor.futures.result('finished') == 8
+    assert finished in executor.futures
+    assert isinstance(executor.futures.exception('failed'), ValueError)
+    assert executor.futures.exception('failed').__traceback__ is None
+    assert 'boom' in executor.futures.traceback('failed')
+    # The submitter's own Future keeps the frames of the task
+    frames = traceback.extract_tb(failed.exception().__traceback__)
+    assert 'fail' in [frame.name for frame in frames]
+    assert executor.futures.by_state() == {
+        'pending': [], 'running': [], 'cancelled': ['cancelled'],
+        'failed': ['failed'], 'finished': ['finished']
+    }
+    record = executor.futures.pop('failed')
+    assert isinstance(record, CompletedFuture)
+    with pytest.raises(ValueError):
+        record.result()
+    with pytest.raises(concurrent.futures.CancelledError):
+        executor.futures.result('cancelled')
+    del finished
+    gc.collect()
+    assert executor.futures.pop('finished').result() == 8
+
+
+class UnusualError(Exception):
+    # Can't be rebuilt from its args, so can't be copied
+
+    def __init__(self, a, b):
+        super().__init__(a + b)
+
+
+def test_compact_retention_releases_future(default_app):
+    futures = FutureCollection(retention='compact')
+    future = concurrent.futures.Future()
+    futures.add('task', future)
+    future.set_result(1)
+    ref = weakref.ref(future)
+    del future
+    gc.collect()
+    assert ref() is None
+    assert futures.result('task') == 1
+    futures.pop('task')
+    unusual = concurrent.futures.Future()
+    futures.add('unusual', unusual)
+    unusual.set_exception(UnusualError(1, 2))
+    assert 'UnusualError' in str(futures.exception('unusual'))
+    futures.pop('unusual')
+    late = concurrent.futures.Future()
+    futures.add('late', late)
+    futures.pop('late')
+    late.set_result(2)
+    assert len(futures) == 0
+    with pytest.raises(ValueError):
+        FutureCollection(retention='weak')
+    default_app.config['EXECUTOR_FUTURES_RETENTION'] = 'weak'
+    with pytest.raises(ValueError):
+        Executor(default_app)
@@ -0,0 +1,132 @@
+import concurrent.futures
+import random
+import threading
+import time
+
+import pytest
+from flask import request
+
+from flask_executor import Executor
+from flask_executor.partition import Partitioner
+
+
+def test_partitions_run_in_order():
+    # Enough slack that no key is moved, so each stays on one thread
+    partitioner = Partitioner(lanes=4, slack=1000)
+    runs = {key: [] for key in 'abcdefgh'}
+    threads = {key: set() for key in runs}
+    running = set()
+    overlaps = []
+
+    def record(key, i):
+        if key in running:
+            overlaps.append(key)
+        running.add(key)
+        threads[key].add(threading.get_ident())
+        time.sleep(random.random() / 1000)
+        runs[key].append(i)
+        running.discard(key)
+
+    futures = [partitioner.submit(key, record, key, i) for i in range(50) for key in runs]
+    concurrent.futures.wait(futures, timeout=10)
+    assert all(run == list(range(50)) for run in runs.values())
+    assert overlaps == []
+    assert all(len(idents) == 1 for idents in threads.values())
+    assert partitioner.depths() == [0] * 4
+    partitioner.shutdown()
+
+
+def test_hot_lanes_are_avoided():
+    partitioner = Partitioner(lanes=2, slack=1)
+    release = threading.Event()
+    # Integers hash to themselves, so 0 and 2 share a lane
+    futures = [partitioner.submit(0, release.wait, 5) for _ in range(4)]
+    futures.append(partitioner.submit(2, pow, 2, 3))
+    assert partitioner.lane(0) == 0
+    # Key 2 would wait behind key 0 if it hadn't moved to the other lane
+    assert futures[-1].result(timeout=1) == 8
+    release.set()
+    concurrent.futures.wait(futures, timeout=5)
+    assert partitioner.lane(0) is None
+    partitioner.shutdown()
+
+
+def test_cancelled_partitioned_task():
+    partitioner = Partitioner(lanes=1)
+    release = threading.Event()
+    first = partitioner.submit('a', release.wait, 5)
+    second = partitioner.submit('a', pow, 2, 3)
+    assert second.cancel()
+    release.set()
+    assert first.result(timeout=5)
+    partitioner.shutdown()
+    assert partitioner.lane('a') is None
+    with pytest.raises(RuntimeError):
+        partitioner.submit('a', pow, 2, 3)
+
+
+def test_partitioner_shutdown_cancels_queued_tasks():
+    partitioner = Partitioner(lanes=1)
+    release = threading.Event()
+    first = partitioner.submit('a', release.wait, 5)
+    queued = partitioner.submit('b', pow, 2, 3)
+    while not first.running():
+        time.sleep(0.01)
+    partitioner.shutdown(wait=False, cancel_futures=True)
+    assert queued.cancelled()
+    release.set()
+    assert first.result(timeout=1)
+
+
+def test_submit_partitioned(default_app):
+    default_app.config['EXECUTOR_MAX_WORKERS'] = 4
+    executor = Executor(default_app)
+    executor.partitioner.slack = 1000
+    seen = []
+
+    def handle(tenant, i):
+        seen.append((tenant, i, request.path, threading.get_ident()))
+
+    with default_app.test_request_context('/events'):
+        futures = [executor.submit_partitioned(tenant, handle, tenant, i)
+                   for i in range(10) for tenant in ('a', 'b')]
+    for future in futures:
+        future.result(timeout=5)
+    for tenant in ('a', 'b'):
+        runs = [run for run in seen if run[0] == tenant]
+        assert [i for _, i, _, _ in runs] == list(range(10))
+        assert len({ident for _, _, _, ident in runs}) == 1
+    assert {path for _, _, path, _ in seen} == {'/events'}
+    assert executor.partitioner.depths() == [0] * 4
+    executor.shutdown()
+    assert all(not thread.is_alive() for thread in executor.partitioner._threads if thread)
+
+
+def test_partitioned_job(default_app):
+    executor = Executor(default_app)
+    order = []
+
+    @executor.job(partition_key=lambda account, amount: account)
+    def apply(account, amount):
+        order.append((account, amount))
+
+    with default_app.test_request_context(''):
+        list(apply.map(['x', 'y', 'x', 'y'], [1, 2, 3, 4], timeout=5))
+        apply.submit('x', 5).result(timeout=5)
+    assert [amount for account, amount in order if account == 'x'] == [1, 3, 5]
+
+
+def test_partitioned_task_restrictions(default_app):
+    default_app.config['EXECUTOR_RETRY_MAX_ATTEMPTS'] = 3
+    executor = Executor(default_app)
+    with default_app.test_request_context(''):
+        with pytest.raises(TypeError):
+            executor.submit_partitioned('a', pow, 2, 3)
+
+
+def test_partitioned_process_executor(default_app):
+    default_app.config['EXECUTOR_TYPE'] = 'process'
+    executor = Executor(default_app)
+    with default_app.test_request_context(''):
+        with pytest.raises(TypeError):
+            executor.submit_partitioned('a', pow, 2, 3)
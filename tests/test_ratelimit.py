@@ -0,0 +1,49 @@
+import time
+
+import pytest
+
+from flask_executor.ratelimit import TokenBucket, parse_rate
+
+
+def test_parse_rate():
+    assert parse_rate(5) == 5.0
+    assert parse_rate('100/s') == 100.0
+    assert parse_rate('30/m') == 0.5
+    assert parse_rate('3600/h') == 1.0
+    assert parse_rate('5/10s') == 0.5
+    assert parse_rate('2 / minute') == pytest.approx(2 / 60)
+
+
+@pytest.mark.parametrize('rate', ['fast', '10/fortnight', '0/s', -1])
+def test_parse_invalid_rate(rate):
+    with pytest.raises(ValueError):
+        parse_rate(rate)
+
+
+def test_token_bucket_reserve():
+    now = time.monotonic() + 1000
+    bucket = TokenBucket('10/s')
+    assert bucket.reserve(now) == now
+    assert bucket.reserve(now) == pytest.approx(now + 0.1)
+    assert bucket.reserve(now) == pytest.approx(now + 0.2)
+    # Tokens aren't banked beyond the burst size while idle
+    assert bucket.reserve(now + 100) == now + 100
+    assert bucket.reserve(now + 100) == pytest.approx(now + 100.1)
+
+
+def test_token_bucket_burst():
+    now = time.monotonic() + 1000
+    bucket = TokenBucket('10/s', burst=3)
+    assert [bucket.reserve(now) for _ in range(3)] == [now] * 3
+    assert bucket.reserve(now) == pytest.approx(now + 0.1)
+
+
+def test_token_bucket_reserve_in_the_past():
+    bucket = TokenBucket('1/s')
+    assert bucket.reserve(0) >= time.monotonic() - 1
+    assert bucket.reserve(0) >= time.monotonic() + 0.5
+
+
+def test_token_bucket_invalid_burst():
+    with pytest.raises(ValueError):
+        TokenBucket('10/s', burst=0)
@@ -0,0 +1,124 @@
+import threading
+import time
+
+import pytest
+
+from flask_executor import Executor
+from flask_executor.resources import ResourceBudget
+
+
+def test_budget_acquire_and_release():
+    budget = ResourceBudget({'memory': 4})
+    started = []
+    assert budget.acquire('a', {'memory': 3}, None)
+    assert not budget.acquire('b', {'memory': 2}, lambda: started.append('b'))
+    assert len(budget) == 1
+    budget.release({'memory': 3})
+    assert started == ['b']
+    assert budget.available == {'memory': 2}
+
+
+def test_budget_does_not_starve_heavy_requests():
+    budget = ResourceBudget({'memory': 4, 'db': 2})
+    started = []
+    assert budget.acquire('light', {'memory': 1}, None)
+    assert not budget.acquire('heavy', {'memory': 4}, lambda: started.append('heavy'))
+    # Later requests for the memory the heavy one waits for queue behind it,
+    # while those for other resources go ahead
+    assert not budget.acquire('light2', {'memory': 1}, lambda: started.append('light2'))
+    assert budget.acquire('db', {'db': 1}, None)
+    budget.release({'memory': 1})
+    assert started == ['heavy']
+    budget.release({'memory': 4})
+    assert started == ['heavy', 'light2']
+
+
+def test_budget_discard():
+    budget = ResourceBudget({'memory': 4})
+    started = []
+    budget.acquire('a', {'memory': 3}, None)
+    budget.acquire('heavy', {'memory': 4}, lambda: started.append('heavy'))
+    budget.acquire('light', {'memory': 1}, lambda: started.append('light'))
+    budget.discard('heavy')
+    assert started == ['light']
+
+
+def test_budget_check():
+    budget = ResourceBudget({'memory': 4})
+    with pytest.raises(ValueError):
+        budget.check({'gpu': 1})
+    with pytest.raises(ValueError):
+        budget.check({'memory': 5})
+    budget.check({'memory': 4})
+
+
+class Concurrency:
+
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, duration):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(duration)
+        with self.lock:
+            self.running -= 1
+
+
+def test_weighted_jobs(default_app):
+    default_app.config['EXECUTOR_MAX_WORKERS'] = 4
+    executor = Executor(default_app)
+    heavy = Concurrency()
+    light = Concurrency()
+    heavy_job = executor.job(heavy, weight=2)
+    with default_app.test_request_context(''):
+        futures = [heavy_job.submit(0.05) for _ in range(6)]
+        futures += [executor.submit(light, 0.05) for _ in range(4)]
+        for future in futures:
+            future.result(timeout=5)
+    assert heavy.peak == 2
+    assert light.peak >= 2
+    assert executor.budget.available == {'workers': 4}
+
+
+def test_resource_budgets(default_app):
+    default_app.config['EXECUTOR_MAX_WORKERS'] = 4
+    default_app.config['EXECUTOR_RESOURCES'] = {'memory': 3}
+    executor = Executor(default_app)
+    big = Concurrency()
+    big_job = executor.job(big, resources={'memory': 2})
+    with default_app.test_request_context(''):
+        assert list(big_job.map([0.02] * 4, timeout=5)) == [None] * 4
+    assert big.peak == 1
+    assert executor.budget.available == {'memory': 3, 'workers': 4}
+
+
+def test_cancel_waiting_task(default_app):
+    default_app.config['EXECUTOR_RESOURCES'] = {'memory': 1}
+    executor = Executor(default_app)
+    release = threading.Event()
+    wait_job = executor.job(release.wait, resources={'memory': 1})
+    with default_app.test_request_context(''):
+        running = wait_job.submit(5)
+        waiting = wait_job.submit(5)
+        assert len(executor.budget) == 1
+        assert waiting.cancel()
+        assert len(executor.budget) == 0
+        release.set()
+        assert running.result(timeout=5)
+    assert executor.budget.available['memory'] == 1
+
+
+def test_invalid_needs(default_app):
+    default_app.config['EXECUTOR_MAX_WORKERS'] = 2
+    executor = Executor(default_app)
+    with pytest.raises(ValueError):
+        executor.job(pow, weight=0)
+    with default_app.test_request_context(''):
+        with pytest.raises(ValueError):
+            executor.job(pow, weight=3).submit(2, 3)
+        with pytest.raises(ValueError):
+            executor.job(pow, resources={'gpu': 1}).submit(2, 3)
@@ -0,0 +1,28 @@
+import pytest
+
+from flask_executor import RetryPolicy
+
+
+def test_retry_policy_should_retry():
+    policy = RetryPolicy(max_attempts=3, retry_on=(IOError,), giveup_on=(FileNotFoundError,))
+    assert policy.should_retry(1, IOError())
+    assert policy.should_retry(2, IOError())
+    assert not policy.should_retry(3, IOError())
+    assert not policy.should_retry(1, ValueError())
+    assert not policy.should_retry(1, FileNotFoundError())
+
+
+def test_retry_policy_backoff():
+    policy = RetryPolicy(backoff=1, multiplier=2, max_backoff=5, jitter=False)
+    assert [policy.delay(attempt) for attempt in range(1, 5)] == [1, 2, 4, 5]
+    policy.jitter = True
+    assert all(0 <= policy.delay(3) <= 4 for _ in range(20))
+
+
+def test_retry_policy_coerce():
+    policy = RetryPolicy()
+    assert RetryPolicy.coerce(None) is None
+    assert RetryPolicy.coerce(policy) is policy
+    assert RetryPolicy.coerce(4).max_attempts == 4
+    with pytest.raises(ValueError):
+        RetryPolicy.coerce(0)
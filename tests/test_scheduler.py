@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+
+from flask_executor.scheduler import PeriodicTask, Scheduler
+
+
+def test_call_later_ordering():
+    scheduler = Scheduler()
+    fired = []
+    done = threading.Event()
+    scheduler.call_later(0.2, lambda: (fired.append(2), done.set()))
+    scheduler.call_later(0.1, fired.append, 1)
+    scheduler.call_later(0, fired.append, 0)
+    assert done.wait(2)
+    assert fired == [0, 1, 2]
+    scheduler.shutdown()
+
+
+def test_cancel_timer():
+    scheduler = Scheduler()
+    fired = []
+    timer = scheduler.call_later(0.05, fired.append, 1)
+    assert len(scheduler) == 1
+    assert timer.cancel() is True
+    assert timer.cancel() is False
+    assert len(scheduler) == 0
+    time.sleep(0.1)
+    assert fired == []
+    scheduler.shutdown()
+
+
+def test_shutdown_returns_pending():
+    scheduler = Scheduler()
+    timer = scheduler.call_later(60, print)
+    assert scheduler.shutdown() == [timer]
+    with pytest.raises(RuntimeError):
+        scheduler.call_later(0, print)
+
+
+def test_timer_exception_is_logged(caplog):
+    scheduler = Scheduler()
+    done = threading.Event()
+
+    def fail():
+        raise ValueError('boom')
+
+    scheduler.call_later(0, fail)
+    scheduler.call_later(0.01, done.set)
+    assert done.wait(2)
+    assert 'exception calling timer' in caplog.text
+    scheduler.shutdown()
+
+
+def test_periodic_task_cancels_quietly_on_shutdown(caplog):
+    scheduler = Scheduler()
+    fired = threading.Event()
+
+    def submit():
+        fired.set()
+        raise RuntimeError('cannot schedule new futures after shutdown')
+
+    periodic_task = PeriodicTask(scheduler, 0.01, submit).start()
+    assert fired.wait(2)
+    time.sleep(0.05)
+    assert periodic_task.cancelled
+    assert 'exception calling timer' not in caplog.text
+    scheduler.shutdown()
@@ -0,0 +1,174 @@
+import concurrent.futures
+import gc
+import threading
+import time
+
+import pytest
+from flask import request
+
+from flask_executor import Executor, RetryPolicy
+from flask_executor.streaming import ResultStream
+
+
+def count(n):
+    for i in range(n):
+        yield i
+
+
+def fail_after(n):
+    yield from range(n)
+    raise ValueError('boom')
+
+
+def test_stream_chunks(default_app):
+    executor = Executor(default_app)
+    with default_app.test_request_context(''):
+        stream = executor.submit(count, 100)
+    assert isinstance(stream, ResultStream)
+    assert list(stream) == list(range(100))
+    assert stream.future.result(timeout=5) is None
+
+
+def test_stream_backpressure(default_app):
+    default_app.config['EXECUTOR_STREAM_BUFFER'] = 2
+    executor = Executor(default_app)
+    produced = []
+
+    def produce():
+        for i in range(10):
+            produced.append(i)
+            yield i
+
+    with default_app.test_request_context(''):
+        stream = executor.submit(produce)
+    chunks = stream.chunks(timeout=5)
+    assert next(chunks) == 0
+    # The worker fills the buffer, then waits for the consumer
+    time.sleep(0.2)
+    assert len(produced) <= 4
+    assert list(chunks) == list(range(1, 10))
+
+
+def test_stream_error(default_app):
+    executor = Executor(default_app)
+    with default_app.test_request_context(''):
+        stream = executor.submit(fail_after, 3)
+    chunks = []
+    with pytest.raises(ValueError):
+        for chunk in stream:
+            chunks.append(chunk)
+    assert chunks == [0, 1, 2]
+    assert isinstance(stream.future.exception(timeout=5), ValueError)
+
+
+def test_stream_close_stops_producer(default_app):
+    default_app.config['EXECUTOR_STREAM_BUFFER'] = 1
+    executor = Executor(default_app)
+    closed = threading.Event()
+
+    def endless():
+        try:
+            i = 0
+            while True:
+                yield i
+                i += 1
+        finally:
+            closed.set()
+
+    with default_app.test_request_context(''):
+        stream = executor.submit(endless)
+    chunks = stream.chunks(timeout=5)
+    assert next(chunks) == 0
+    chunks.close()
+    assert closed.wait(5)
+    assert stream.future.result(timeout=5) is None
+
+
+def test_cancelled_stream(default_app):
+    default_app.config['EXECUTOR_MAX_WORKERS'] = 1
+    executor = Executor(default_app)
+    release = threading.Event()
+    with default_app.test_request_context(''):
+        executor.submit(release.wait, 5)
+        stream = executor.submit(count, 3)
+        assert stream.future.cancel()
+    release.set()
+    with pytest.raises(concurrent.futures.CancelledError):
+        list(stream)
+
+
+def test_stream_timeout(default_app):
+    executor = Executor(default_app)
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        yield 1
+
+    with default_app.test_request_context(''):
+        stream = executor.submit(slow)
+    with pytest.raises(concurrent.futures.TimeoutError):
+        list(stream.chunks(timeout=0.05))
+    release.set()
+
+
+def test_stream_jobs_are_not_retried(default_app):
+    executor = Executor(default_app)
+    attempts = []
+
+    @executor.job(retry=RetryPolicy(max_attempts=3, backoff=0))
+    def flaky():
+        attempts.append(1)
+        yield 1
+        raise IOError
+
+    with default_app.test_request_context(''):
+        stream = flaky.submit()
+    with pytest.raises(IOError):
+        list(stream)
+    assert len(attempts) == 1
+
+
+def test_stream_response(default_app):
+    executor = Executor(default_app)
+
+    def lines():
+        yield 'path: {}\n'.format(request.path)
+        for i in range(3):
+            yield '{}\n'.format(i)
+
+    @default_app.route('/export')
+    def export():
+        return executor.submit(lines).response(mimetype='text/plain')
+
+    response = default_app.test_client().get('/export')
+    assert response.mimetype == 'text/plain'
+    assert response.get_data(as_text=True) == 'path: /export\n0\n1\n2\n'
+
+
+def test_stream_requires_threads(default_app):
+    default_app.config['EXECUTOR_TYPE'] = 'process'
+    executor = Executor(default_app)
+    with default_app.test_request_context(''):
+        with pytest.raises(TypeError):
+            executor.submit(count, 3)
+
+
+def test_dropped_stream_releases_worker(default_app):
+    default_app.config['EXECUTOR_MAX_WORKERS'] = 1
+    default_app.config['EXECUTOR_STREAM_BUFFER'] = 1
+    executor = Executor(default_app)
+
+    def forever():
+        while True:
+            yield 'chunk'
+
+    with default_app.test_request_context(''):
+        stream = executor.submit(forever)
+        future = stream.future
+        time.sleep(0.05)
+        del stream
+        gc.collect()
+        assert executor.submit(pow, 2, 3).result(timeout=2) == 8
+    assert future.result(timeout=1) is None
+    executor.shutdown(wait=True)
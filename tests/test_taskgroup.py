@@ -0,0 +1,97 @@
+import threading
+import time
+
+from flask import Flask
+import pytest
+
+from flask_executor import Executor
+
+
+def test_task_group_waits_on_exit(default_app):
+    executor = Executor(default_app)
+    with default_app.test_request_context(''):
+        outside = executor.submit(time.sleep, 0.2)
+        with executor.task_group() as group:
+            executor.submit(time.sleep, 0.1)
+            executor.submit(pow, 2, 3)
+            results = list(executor.map(pow, [2, 3], [2, 2]))
+        assert len(group) == 4
+        assert all(future.done() for future in group.futures)
+        assert outside not in group.futures
+    assert results == [4, 9]
+
+
+def test_task_group_timeout_cancels_queued(default_app):
+    default_app.config['EXECUTOR_MAX_WORKERS'] = 1
+    executor = Executor(default_app)
+    with default_app.test_request_context(''):
+        with executor.task_group(timeout=0.05) as group:
+            running = executor.submit(time.sleep, 0.2)
+            queued = executor.submit(pow, 2, 3)
+        assert not running.cancelled()
+        assert queued.cancelled()
+        done, not_done = group.wait_all(timeout=2)
+        assert len(done) == 2
+
+
+def test_task_group_cancels_on_error(default_app):
+    default_app.config['EXECUTOR_MAX_WORKERS'] = 1
+    executor = Executor(default_app)
+    with default_app.test_request_context(''):
+        with pytest.raises(ZeroDivisionError):
+            with executor.task_group() as group:
+                executor.submit(time.sleep, 0.1)
+                queued = executor.submit(pow, 2, 3)
+                1 / 0
+        assert queued.cancelled()
+        assert group.cancel_all() == 0
+
+
+def test_task_group_after_response():
+    app = Flask(__name__)
+    executor = Executor(app)
+    ran = threading.Event()
+    groups = []
+
+    @app.route('/')
+    def index():
+        with executor.task_group(after_response=True) as group:
+            executor.submit(ran.set)
+        groups.append(group)
+        with pytest.raises(RuntimeError):
+            group.wait_all()
+        assert not ran.wait(0.1)
+        return 'OK'
+
+    response = app.test_client().get('/')
+    assert response.data == b'OK'
+    response.close()
+    assert ran.wait(2)
+    assert groups[0].futures[0].result(timeout=2) is None
+
+
+def test_task_group_after_response_cancelled_on_error():
+    app = Flask(__name__)
+    executor = Executor(app)
+    groups = []
+
+    @app.route('/')
+    def index():
+        with executor.task_group(after_response=True) as group:
+            executor.submit(pow, 2, 3)
+            executor.submit_after(0.1, pow, 2, 3)
+        groups.append(group)
+        raise ValueError
+
+    response = app.test_client().get('/')
+    assert response.status_code == 500
+    response.close()
+    assert all(future.cancelled() for future in groups[0].futures)
+
+
+def test_task_group_after_response_needs_request(default_app):
+    executor = Executor(default_app)
+    with default_app.app_context():
+        with pytest.raises(RuntimeError):
+            with executor.task_group(after_response=True):
+                pass
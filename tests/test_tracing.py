@@ -0,0 +1,83 @@
+import contextvars
+
+from flask import request
+
+from flask_executor import Executor
+
+
+request_id = contextvars.ContextVar('request_id', default=None)
+
+
+def get_request_id():
+    return request_id.get()
+
+
+def fail():
+    raise ValueError
+
+
+def test_context_vars_are_copied(default_app):
+    default_app.config['EXECUTOR_MAX_WORKERS'] = 4
+    executor = Executor(default_app)
+    with default_app.test_request_context(''):
+        token = request_id.set('abc')
+        future = executor.submit(get_request_id)
+        results = list(executor.map(lambda _: get_request_id(), range(8)))
+        request_id.reset(token)
+        assert future.result() == 'abc'
+        assert results == ['abc'] * 8
+        assert executor.submit(get_request_id).result() is None
+
+
+def test_context_vars_not_copied(default_app):
+    default_app.config['EXECUTOR_COPY_CONTEXTVARS'] = False
+    executor = Executor(default_app)
+    with default_app.test_request_context(''):
+        request_id.set('abc')
+        assert executor.submit(get_request_id).result() is None
+
+
+def test_task_group_not_joined_by_workers(default_app):
+    executor = Executor(default_app)
+    with default_app.test_request_context(''):
+        with executor.task_group() as group:
+            executor.submit(lambda: executor.submit(pow, 2, 3).result()).result()
+    assert len(group) == 1
+
+
+def test_span_hooks(default_app):
+    executor = Executor(default_app)
+    events = []
+
+    def start(span):
+        span.data['path'] = request.path
+        events.append(('start', span.name, get_request_id()))
+
+    def error(span, exc):
+        events.append(('error', span.name, type(exc)))
+
+    def end(span):
+        assert span.queued >= 0
+        assert span.duration >= 0
+        events.append(('end', span.name, span.data['path']))
+
+    executor.add_span_hooks(start=start, end=end, error=error)
+    with default_app.test_request_context('/report'):
+        request_id.set('abc')
+        executor.submit(get_request_id).result()
+        executor.submit(fail).exception()
+    assert events == [
+        ('start', 'get_request_id', 'abc'),
+        ('end', 'get_request_id', '/report'),
+        ('start', 'fail', 'abc'),
+        ('error', 'fail', ValueError),
+        ('end', 'fail', '/report'),
+    ]
+
+
+def test_span_hook_errors_are_logged(default_app, caplog):
+    executor = Executor(default_app)
+    executor.add_span_hooks(start=fail)
+    with default_app.test_request_context(''):
+        assert executor.submit(pow, 2, 3).result() == 8
+    assert 'exception calling span hook' in caplog.text
@@ -0,0 +1,85 @@
+import concurrent.futures
+import threading
+import time
+
+import pytest
+
+from flask_executor.workstealing import WorkStealingExecutor
+
+
+def test_submit_and_map():
+    executor = WorkStealingExecutor(max_workers=2)
+    assert executor.submit(pow, 2, 3).result(timeout=2) == 8
+    assert list(executor.map(pow, [2, 3], [2, 2], timeout=2)) == [4, 9]
+    executor.shutdown()
+
+
+def test_max_workers():
+    executor = WorkStealingExecutor(max_workers=2)
+    assert executor._max_workers == 2
+    with pytest.raises(ValueError):
+        WorkStealingExecutor(max_workers=0)
+    futures = [executor.submit(time.sleep, 0.05) for _ in range(5)]
+    concurrent.futures.wait(futures, timeout=2)
+    assert len(executor._threads) == 2
+    executor.shutdown()
+
+
+def test_nested_tasks_help_while_waiting():
+    executor = WorkStealingExecutor(max_workers=1)
+
+    def total(n):
+        if n <= 1:
+            return n
+        futures = [executor.submit(total, n // 2), executor.submit(total, n - n // 2)]
+        for future in futures:
+            executor.help_until(future)
+        return sum(future.result(timeout=0) for future in futures)
+
+    assert executor.submit(total, 64).result(timeout=5) == 64
+    executor.shutdown()
+
+
+def test_help_until_timeout():
+    executor = WorkStealingExecutor(max_workers=2)
+    release = threading.Event()
+
+    def parent():
+        child = executor.submit(release.wait, 2)
+        # The other worker picks up the child, so there's nothing to help with
+        time.sleep(0.05)
+        return executor.help_until(child, timeout=0.05)
+
+    assert executor.submit(parent).result(timeout=2) == 0.0
+    release.set()
+    assert executor.help_until(executor.submit(pow, 2, 3), timeout=1) == 1
+    executor.shutdown()
+
+
+def test_idle_workers_steal():
+    executor = WorkStealingExecutor(max_workers=2)
+    threads = set()
+
+    def child():
+        time.sleep(0.05)
+        threads.add(threading.current_thread())
+
+    def parent():
+        futures = [executor.submit(child) for _ in range(4)]
+        concurrent.futures.wait(futures, timeout=2)
+        return len(threads)
+
+    assert executor.submit(parent).result(timeout=2) == 1
+    executor.shutdown()
+
+
+def test_shutdown():
+    executor = WorkStealingExecutor(max_workers=1)
+    running = executor.submit(time.sleep, 0.1)
+    queued = executor.submit(pow, 2, 3)
+    time.sleep(0.05)
+    executor.shutdown(wait=True, cancel_futures=True)
+    assert running.result() is None
+    assert queued.cancelled()
+    with pytest.raises(RuntimeError):
+        executor.submit(pow, 2, 3)